@@ -4,27 +4,47 @@ from config import *
 from camera import Camera
 import game_state
 from hand_tracker import HandTracker
-from game_objects import Puck, Paddle, TargetManager
 from renderer import Renderer
-from physics import PhysicsEngine
-from game_state import GameState
+from simulation import GameSimulation
+from profiler import make_profiler
+from recording import ReplaySource, ReplayTracker, TrackingRecorder, TrackingRecording
+from outputs import make_outputs
 
 class AirHockeyGame:
-    def __init__(self):
-        """Initialize the air hockey game"""
-        self.camera = Camera()
-        self.hand_tracker = HandTracker()
-        self.puck = Puck()
-        self.paddle = Paddle()
-        self.target_manager = TargetManager()
+    def __init__(self, camera=None, hand_tracker=None, clock=time.time):
+        """Initialize the air hockey game
+
+        The hand model loads on a background thread while the camera opens and the rest is set up.
+        A `camera` or `hand_tracker` passed in is used instead of its default; `clock` times the game
+        and the frames of the default camera.
+        """
+        self.clock = clock
+        # Replays need neither a camera nor MediaPipe
+        recording = TrackingRecording(REPLAY_PATH) if REPLAY_PATH and (camera is None or hand_tracker is None) else None
+        if hand_tracker is None:
+            hand_tracker = ReplayTracker(recording) if recording is not None else HandTracker()
+        if camera is None:
+            camera = Camera(source=ReplaySource(recording), clock=clock) if recording is not None else Camera(clock=clock)
+        self.hand_tracker = hand_tracker
+        self.camera = camera
+        self.recorder = TrackingRecorder(RECORD_PATH) if RECORD_PATH else None
+        # Spectator stream and video files, encoded off the game loop
+        self.outputs = make_outputs()
         self.renderer = Renderer()
-        self.physics = PhysicsEngine()
-        self.game_state = GameState()
+        self.profiler = make_profiler()
+        # The game clock starts with the simulation, so it waits for the model
+        self.hand_tracker.wait_until_ready()
+        self.simulation = GameSimulation(clock, profiler=self.profiler)
+        self.game_state = self.simulation.game_state
+        self.previous_time = clock()
+        # Profiling overlay state: latest percentiles, when they were taken, and whether it is shown
+        self.overlay_stats, self.overlay_time = {}, 0
+        self.show_overlay = PROFILE_OVERLAY
         
     def run(self):
         """Main game loop"""
         # Error handling for camera
-        if not self.camera.cap.isOpened():
+        if not self.camera.is_opened():
             print("Error: Could not open camera")
             return
             
@@ -32,54 +52,63 @@ class AirHockeyGame:
         print("Air Hockey Game Started!")
         print("Use your index finger to control the paddle")
         print("Press 'q' to quit")
+        if PROFILING_ENABLED:
+            print("Press 'p' to toggle the profiling overlay")
         
+        self.previous_time = self.clock()
         while True:
-            # Read camera frame (& flip it for selfie view)
-            frame, success = self.camera.read_frame()
-            if not success:
-                print('Ignoring empty camera frame')
+            frame = self.read_frame()
+            if frame is None:
                 break
             
-            # Convert to RGB for processing (OpenCV uses BGR)
-            image = self.camera.convert_to_rgb(frame)
-            
-            # Process hand tracking
-            results = self.hand_tracker.process_frame(image)
-            
-            # FEATURE TO ADD:
-            # There should be a tracking of paddle's velocity.
-            # The paddle's velocity can be accounted in collision with the puck
-            # Update paddle position
-            paddle_position = self.hand_tracker.get_paddle_position(results)
-            if paddle_position:
-                self.paddle.update_position(paddle_position)
-            
-            # Update puck position
-            current_time = time.time()
-            self.puck.update_position()
+            paddle_positions, current_time = self.track_hands(frame)
+            self.update_game(paddle_positions, current_time)
+            # The game draws straight onto the BGR frame
+            self.draw_game(frame, current_time)
+            key = self.show(frame)
             
-            self.physics.check_wall_collision(self.puck)
-            # NEEDS TO BE FIXED:
-            # Does not work perfectly for collisions with very small collision normal 
-            # i.e. (collision normal almost perpendicular to velocity)
-            # Does not work when the paddle crosses the puck in its direction.
-            self.physics.check_paddle_collision(self.puck, self.paddle, current_time)
-            
-            # Check target collisions
-            newly_hit_targets = self.target_manager.check_collisions(self.puck)
-            for target in newly_hit_targets:
-                self.game_state.add_score()
-                # NEEDS TO BE TESTED --- Might not work properly in this context
-                self.puck.increase_velocity()
-            
-            # Check game end conditions
-            self.game_state.check_game_end(self.target_manager.all_targets_hit())
-            
-            # Render everything
-            self.renderer.overlay_targets(image, self.target_manager.targets)
-            self.renderer.overlay_circle(image, self.puck.position, self.puck.radius, PUCK_COLOR)
-            self.renderer.overlay_circle(image, self.paddle.position, self.paddle.radius, PADDLE_COLOR)
+            # Display final screen for a few seconds
+            if self.game_state.game_over and self.game_state.get_elapsed_time() > self.game_state.game_duration + END_SCREEN_DURATION:
+                break
             
+            # Check for quit
+            if key == ord('q'):
+                break
+        
+        self.close()
+    
+    def read_frame(self):
+        """Read a camera frame (flipped for selfie view), or None when there are no more"""
+        with self.profiler.span('capture'):
+            frame, success = self.camera.read_frame()
+        if not success:
+            print('Ignoring empty camera frame')
+            return None
+        return frame
+    
+    def track_hands(self, frame):
+        """Run hand tracking on a frame; returns the paddle positions (one per player) and the current time"""
+        # In async mode this returns the previous frame's result. The tracker converts to RGB itself.
+        with self.profiler.span('inference'):
+            results = self.hand_tracker.process_frame(frame, self.camera.frame_timestamp)
+        if self.recorder is not None:
+            self.recorder.record(results)
+        
+        # Extrapolated to the current time to hide tracking latency
+        current_time = self.clock()
+        return self.hand_tracker.get_paddle_positions(results, current_time), current_time
+    
+    def update_game(self, paddle_positions, current_time):
+        """Move the paddles and run the physics for the time since the last frame"""
+        frame_time = current_time - self.previous_time
+        self.previous_time = current_time
+        self.simulation.update(frame_time, paddle_positions)
+    
+    def draw_game(self, image, current_time):
+        """Render the game entities, the UI and, once the game is over, the end screen"""
+        self.simulation.render(image, self.renderer)
+        
+        with self.profiler.span('ui'):
             # Draw UI
             self.renderer.draw_ui(image, self.game_state.score, self.game_state.get_remaining_time(), self.game_state.game_over)
             
@@ -89,25 +118,44 @@ class AirHockeyGame:
                     self.renderer.draw_victory(image, self.game_state.score, self.game_state.game_won_time)
                 else:
                     self.renderer.draw_game_over(image, self.game_state.score)
-                
-                # Display final screen for a few seconds
-                display_image = self.camera.convert_to_bgr(image)
-                cv2.imshow('Virtual Air Hockey', display_image)
-                
-                if self.game_state.get_elapsed_time() > self.game_state.game_duration + 10:
-                    break
-            else:
-                # Display normal game frame (Convert from RGB to BGR for OpenCV)
-                display_image = self.camera.convert_to_bgr(image)
-                cv2.imshow('Virtual Air Hockey', display_image)
             
-            # Check for quit
-            if cv2.waitKey(1) & 0xFF == ord('q'):
-                break
-        
-        # Cleanup
-        self.camera.cap.release()
+            # Percentiles are refreshed a few times a second, not every frame
+            if PROFILING_ENABLED and self.show_overlay:
+                if current_time - self.overlay_time >= PROFILE_OVERLAY_REFRESH:
+                    self.overlay_stats, self.overlay_time = self.profiler.get_percentiles(), current_time
+                self.renderer.draw_profiler_overlay(image, self.overlay_stats)
+    
+    def show(self, image):
+        """Display the frame and end the profiled frame; returns the key pressed, 'p' toggles the profiling overlay"""
+        # Outputs only copy the frame here; they never wait for their encoder
+        if self.outputs:
+            with self.profiler.span('output'):
+                for output in self.outputs:
+                    output.write(image, self.camera.frame_timestamp)
+        with self.profiler.span('display'):
+            # Display the frame (already BGR, as OpenCV expects)
+            cv2.imshow('Virtual Air Hockey', image)
+            key = cv2.waitKey(1) & 0xFF
+        self.profiler.end_frame()
+        if key == ord('p'):
+            self.show_overlay = not self.show_overlay
+        return key
+    
+    def close(self):
+        """Release the camera, tracker, recorder and window"""
+        self.camera.release()
+        self.hand_tracker.close()
+        if self.recorder is not None:
+            self.recorder.close()
+            print(f"Recorded {self.recorder.recorded} tracking results to {RECORD_PATH}")
+        for output in self.outputs:
+            output.close()
+            print(f"{type(output).__name__}: {output.written_frames} frames encoded, {output.dropped_frames} dropped")
         cv2.destroyAllWindows()
+        print(f"Camera: {self.camera.captured_frames} frames captured, {self.camera.dropped_frames} dropped")
+        if getattr(self.hand_tracker, 'scheduler', None) is not None:
+            print(f"Hand tracking: inference on {self.hand_tracker.inferred_frames} frames, "
+                  f"{self.hand_tracker.skipped_frames} skipped")
         print("Game ended!")
 
 if __name__ == "__main__":
@@ -0,0 +1,103 @@
+"""
+Batch simulation for tuning game settings
+
+Plays many headless games across a process pool: every combination of the
+settings in a grid, each with the same seeds, so the settings are compared on
+identical target layouts. Paddles follow the scripted sweep or a recorded hand.
+Results go to a columnar .npz file, one array per setting and result field.
+
+    python batch.py                                   # DEFAULT_GRID, 100 seeds each
+    python batch.py --grid "{'target_size': [20, 30, 40]}" --seeds 500
+    python batch.py --replay session.trk --output replay_results.npz
+"""
+
+import argparse
+import ast
+import itertools
+import multiprocessing
+import time
+import numpy as np
+from headless import HeadlessGame, sweep_trajectory
+
+# Setting name (a GameSimulation keyword) -> values to try
+DEFAULT_GRID = {
+    'initial_puck_velocity': [[8, 8], [10, 10], [12, 12]],
+    'target_size': [20, 30],
+}
+
+# Result fields stored per game; time_to_win is NaN for games that were not won
+RESULT_FIELDS = ('score', 'victory', 'time_to_win', 'frames', 'physics_steps', 'paddle_hits')
+
+# Recordings opened by this worker process, by path
+_recordings = {}
+
+def _trajectory(replay_path):
+    """Paddle input of a game: the scripted sweep, or the first hand of a recording"""
+    if replay_path is None:
+        return sweep_trajectory
+    # Only replays need the recording module
+    from recording import ReplayTrajectory, TrackingRecording
+    if replay_path not in _recordings:
+        _recordings[replay_path] = TrackingRecording(replay_path)
+    return ReplayTrajectory(_recordings[replay_path])
+
+def play_game(job):
+    """Play one headless game for a (settings, seed, replay_path) job and return its results"""
+    settings, seed, replay_path = job
+    results = HeadlessGame(_trajectory(replay_path), seed=seed, **settings).run()
+    if results['time_to_win'] is None:
+        results['time_to_win'] = np.nan
+    return results
+
+def make_jobs(grid, seeds, replay_path=None):
+    """One job per combination of settings in `grid` and seed in `seeds`"""
+    names = list(grid)
+    return [(dict(zip(names, values)), seed, replay_path)
+            for values in itertools.product(*(grid[name] for name in names)) for seed in seeds]
+
+def run_batch(jobs, processes=None, chunksize=8):
+    """Play the jobs across a process pool; results come back in job order"""
+    with multiprocessing.Pool(processes) as pool:
+        return pool.map(play_game, jobs, chunksize=chunksize)
+
+def save_results(path, jobs, results):
+    """Write settings, seeds and results as columns, one row per game"""
+    columns = {'seed': np.array([seed for _, seed, _ in jobs])}
+    for name in jobs[0][0]:
+        columns[name] = np.array([settings[name] for settings, _, _ in jobs])
+    for field in RESULT_FIELDS:
+        columns[field] = np.array([result[field] for result in results])
+    np.savez_compressed(path, **columns)
+
+def summarize(jobs, results):
+    """Print win rate, mean time to win and mean paddle hits per settings combination"""
+    groups = {}
+    for (settings, _, _), result in zip(jobs, results):
+        groups.setdefault(repr(settings), []).append(result)
+    for settings, group in groups.items():
+        won = [result['time_to_win'] for result in group if result['victory']]
+        time_to_win = f"{np.mean(won):6.2f}s" if won else "     -"
+        hits = np.mean([result['paddle_hits'] for result in group])
+        print(f"  {settings:<60} win rate {len(won) / len(group):6.1%}  time to win {time_to_win}  paddle hits {hits:5.1f}")
+
+def main():
+    """Run a batch from the command line"""
+    parser = argparse.ArgumentParser(description="Play headless games for every combination of settings in a grid")
+    parser.add_argument('--grid', type=ast.literal_eval, default=DEFAULT_GRID,
+                        help="dict of GameSimulation setting -> list of values, as a Python literal")
+    parser.add_argument('--seeds', type=int, default=100, help="games per settings combination, seeded 0..N-1")
+    parser.add_argument('--replay', default=None, help="hand tracking recording to drive the paddle with")
+    parser.add_argument('--processes', type=int, default=None, help="worker processes (all CPUs by default)")
+    parser.add_argument('--output', default='batch_results.npz', help="columnar results file")
+    args = parser.parse_args()
+
+    jobs = make_jobs(args.grid, range(args.seeds), args.replay)
+    start = time.perf_counter()
+    results = run_batch(jobs, args.processes)
+    elapsed = time.perf_counter() - start
+    save_results(args.output, jobs, results)
+    print(f"{len(jobs)} games in {elapsed:.1f}s ({len(jobs) / elapsed:.1f} games/s), results in {args.output}")
+    summarize(jobs, results)
+
+if __name__ == "__main__":
+    main()
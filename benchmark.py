@@ -0,0 +1,622 @@
+"""
+Micro-benchmarks for the game's hot paths
+
+Run from the project directory:
+    python benchmark.py            # run every benchmark
+    python benchmark.py circle     # run a single benchmark
+    python benchmark.py soak --soak-sessions 3000
+"""
+
+import argparse
+import gc
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import timeit
+import tracemalloc
+from contextlib import contextmanager, redirect_stdout
+import cv2
+import numpy as np
+from camera import Camera, SyntheticSource
+from config import *
+from filters import PADDLE_FILTERS
+from game_objects import Paddle, PaddleSet, PuckSet, TargetManager
+from hand_tracker import INDEX_FINGER_TIP, Classification, HandLandmarks, HandResults, HandTracker, Handedness, Landmark
+from headless import HeadlessGame, SimulatedClock, sweep_trajectory
+from outputs import MJPEGServer, SegmentedVideoWriter
+from physics import PhysicsEngine
+from profiler import FrameProfiler
+from renderer import Renderer
+from session import SessionManager
+from sprites import AlphaSprite
+
+def _report(name, seconds, repeat):
+    """Print the mean time per call in microseconds"""
+    print(f"  {name:<28} {seconds / repeat * 1e6:10.1f} us/call")
+
+def _legacy_overlay_circle(image, obj_position, radius, color):
+    """Per-pixel circle drawing loop used before the sprite cache (kept for comparison)"""
+    obj_roi = image[(obj_position[1] - radius):(obj_position[1] + (radius+1)),
+                   (obj_position[0] - radius):(obj_position[0] + (radius+1))]
+    side_sq = 2 * radius + 1
+    for y in range(side_sq):
+        for x in range(side_sq):
+            if ((y-radius)**2 + (x-radius)**2) <= radius**2:
+                obj_roi[y, x] = np.array(color)
+
+def bench_circle(repeat=200):
+    """Compare the per-pixel circle loop with the cached mask sprite"""
+    renderer = Renderer()
+    image = np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+    center = (VIDEO_X // 2, VIDEO_Y // 2)
+
+    print("overlay_circle")
+    for radius in (PUCK_RADIUS, PADDLE_RADIUS, 48):
+        legacy = timeit.timeit(lambda: _legacy_overlay_circle(image, center, radius, PUCK_COLOR), number=repeat)
+        sprite = timeit.timeit(lambda: renderer.overlay_circle(image, center, radius, PUCK_COLOR), number=repeat)
+        _report(f"loop   r={radius}", legacy, repeat)
+        _report(f"sprite r={radius}", sprite, repeat)
+
+def _legacy_overlay_targets(image, target_image, positions):
+    """Per-channel float64 blending used before the alpha sprite cache (kept for comparison)"""
+    for position in positions:
+        target_roi = image[position[1]: (position[1] + target_image.shape[0]),
+                          position[0]: (position[0] + target_image.shape[1])]
+        opacity = target_image[:, :, 3] / 255.0
+        transparency = 1.0 - opacity
+        for color_code in range(3):
+            target_roi[:, :, color_code] = (
+                opacity * target_image[:, :, color_code] +
+                transparency * target_roi[:, :, color_code]
+            )
+
+def bench_targets(repeat=20):
+    """Compare per-channel blending with the cached alpha sprite, per target and batched"""
+    renderer = Renderer()
+    image = np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+    rng = np.random.RandomState(0)
+
+    # The bundled target image is opaque; a half transparent copy exercises the blend path
+    translucent = renderer.target_image.copy()
+    translucent[:, :, 3] = 128
+    sprites = {'opaque': renderer.target_sprite, 'alpha': AlphaSprite(translucent)}
+
+    print("overlay_targets")
+    for count in (4, 64, 512):
+        positions = rng.randint(0, [VIDEO_X - TARGET_SIZE, VIDEO_Y - TARGET_SIZE], size=(count, 2))
+        for kind, sprite in sprites.items():
+            source = renderer.target_image if kind == 'opaque' else translucent
+            legacy = timeit.timeit(lambda: _legacy_overlay_targets(image, source, positions), number=repeat)
+            single = timeit.timeit(lambda: [sprite.draw(image, p) for p in positions], number=repeat)
+            batch = timeit.timeit(lambda: sprite.draw_batch(image, positions), number=repeat)
+            _report(f"legacy {kind:<6} n={count}", legacy, repeat)
+            _report(f"sprite {kind:<6} n={count}", single, repeat)
+            _report(f"batch  {kind:<6} n={count}", batch, repeat)
+
+class _LegacyTarget:
+    def __init__(self, position):
+        """Target object with per-call hit testing used before the target arrays (kept for comparison)"""
+        self.position = position
+        self.hit = False
+        self.size = TARGET_SIZE
+
+    def is_hit(self, puck):
+        target_center = np.array(self.position) + self.size // 2
+        dxy = abs(target_center - puck.position)
+        dsx, dsy = dxy - self.size // 2
+        db = np.sqrt(max(0, dsx) ** 2 + max(0, dsy) ** 2)
+        distance = np.linalg.norm(puck.position - target_center)
+        return db <= puck.radius or distance < self.size // 2
+
+def _legacy_check_collisions(targets, puck):
+    """Linear scan over every target object used before the spatial index (kept for comparison)"""
+    newly_hit_targets = []
+    for target in targets:
+        if not target.hit and target.is_hit(puck):
+            target.hit = True
+            newly_hit_targets.append(target)
+    return newly_hit_targets
+
+def _puck_path(steps):
+    """Pucks positioned along a fixed bouncing path, one per physics step"""
+    pucks = PuckSet(1)
+    physics = PhysicsEngine()
+    far_away = np.array([-1e3, -1e3])
+    path = []
+    for _ in range(steps):
+        physics.step(pucks, Paddle(), PHYSICS_DT, far_away, far_away)
+        path.append((pucks.previous_positions.copy(), pucks.positions.copy()))
+    return path
+
+def bench_collisions(steps=200):
+    """Compare the linear scan over target objects with the grid and target arrays as the target count grows"""
+    path = _puck_path(steps)
+    pucks = PuckSet(1)
+
+    print("check_collisions")
+    for count in (4, 64, 512, 2048, 10000):
+        np.random.seed(0)
+        target_manager = TargetManager(count)
+        legacy_targets = [_LegacyTarget(position) for position in target_manager.positions]
+
+        start = time.perf_counter()
+        for pucks.previous_positions, pucks.positions in path:
+            _legacy_check_collisions(legacy_targets, pucks[0])
+        _report(f"linear n={count}", time.perf_counter() - start, steps)
+
+        start = time.perf_counter()
+        for pucks.previous_positions, pucks.positions in path:
+            target_manager.check_collisions(pucks)
+        _report(f"grid   n={count}", time.perf_counter() - start, steps)
+
+def bench_pucks(steps=500):
+    """Time one physics step (walls, puck-puck and paddle collisions) as the puck count grows"""
+    physics = PhysicsEngine()
+    paddle = Paddle()
+
+    print("physics step")
+    for count in (1, 10, 50, 200, 1000):
+        np.random.seed(0)
+        pucks = PuckSet(count)
+        # A paddle sweeping across the middle of the field
+        paddle_path = np.stack([np.linspace(50, VIDEO_X - 50, steps + 1), np.full(steps + 1, VIDEO_Y / 2)], axis=1)
+        start = time.perf_counter()
+        for step in range(steps):
+            physics.step(pucks, paddle, PHYSICS_DT, paddle_path[step], paddle_path[step + 1])
+        _report(f"step n={count}", time.perf_counter() - start, steps)
+
+def bench_paddles(steps=500, num_pucks=50):
+    """Time one physics step as the number of paddles (players) grows"""
+    physics = PhysicsEngine()
+
+    print(f"physics step, {num_pucks} pucks")
+    for count in (1, 2, 4, 8):
+        np.random.seed(0)
+        pucks = PuckSet(num_pucks)
+        paddles = PaddleSet(count)
+        # Every paddle sweeps across the field at its own height
+        xs = np.linspace(50, VIDEO_X - 50, steps + 1)
+        ys = np.linspace(50, VIDEO_Y - 50, count)
+        paddle_path = np.stack(np.broadcast_arrays(xs[:, None], ys[None, :]), axis=2)
+        start = time.perf_counter()
+        for step in range(steps):
+            physics.step(pucks, paddles, PHYSICS_DT, paddle_path[step], paddle_path[step + 1])
+        _report(f"step paddles={count}", time.perf_counter() - start, steps)
+
+def bench_filters(seconds=20, rate=30, noise=2.0):
+    """Accuracy and cost of the paddle estimators on a noisy, fast synthetic hand"""
+    rng = np.random.RandomState(0)
+    times = np.arange(0, seconds, 1 / rate) + rng.uniform(-0.003, 0.003, seconds * rate)
+    # The headless sweep at three times its speed, peaking at about 1600 pixels/sec
+    truth = np.array([sweep_trajectory(3 * t) for t in times])
+    velocity = np.array([(np.subtract(sweep_trajectory(3 * (t + 1e-4)), sweep_trajectory(3 * (t - 1e-4)))) / 2e-4 for t in times])
+    ahead = np.array([sweep_trajectory(3 * (t + 0.05)) for t in times])
+    measurements = truth + rng.normal(0, noise, truth.shape)
+    tracked = np.ones(1, dtype=bool)
+
+    print(f"paddle filters ({noise:.0f} px measurement noise, {rate} Hz), RMS errors after the first second")
+    for name, filter_class in PADDLE_FILTERS.items():
+        paddle_filter = filter_class(truth[:1])
+        positions, velocities, predictions = [], [], []
+        elapsed = 0.0
+        for t, measurement in zip(times, measurements):
+            start = time.perf_counter()
+            paddle_filter.update(measurement[None], tracked, t)
+            elapsed += time.perf_counter() - start
+            positions.append(paddle_filter.positions[0].copy())
+            velocities.append(paddle_filter.velocities[0].copy())
+            predictions.append(paddle_filter.predict(t + 0.05)[0])
+        errors = [np.sqrt(np.mean(np.sum((np.array(estimate) - reference)[rate:] ** 2, axis=1)))
+                  for estimate, reference in ((positions, truth), (velocities, velocity), (predictions, ahead))]
+        print(f"  {name:<12} position {errors[0]:6.2f} px  velocity {errors[1]:6.0f} px/s  "
+              f"50 ms ahead {errors[2]:6.2f} px  {elapsed / len(times) * 1e6:6.1f} us/update")
+
+def bench_flow(repeat=200):
+    """Cost of following fingertips with optical flow on a frame where inference is skipped"""
+    rng = np.random.RandomState(0)
+    # Smooth texture, shifted by a few pixels between the two frames
+    texture = cv2.GaussianBlur(rng.randint(0, 256, (VIDEO_Y + 8, VIDEO_X + 8, 3), dtype=np.uint8), (9, 9), 3)
+    previous, current = texture[:VIDEO_Y, :VIDEO_X], texture[5:VIDEO_Y + 5, 3:VIDEO_X + 3]
+    previous_gray = cv2.cvtColor(previous, cv2.COLOR_BGR2GRAY)
+
+    tracker = _SpotTracker(mode='sync')
+
+    print(f"optical flow per skipped frame, forward and back ({VIDEO_X}x{VIDEO_Y})")
+    for hands in (1, 2, 4):
+        points = rng.uniform([50, 50], [VIDEO_X - 50, VIDEO_Y - 50], size=(hands, 2)).astype(np.float32)
+
+        def track():
+            gray = cv2.cvtColor(current, cv2.COLOR_BGR2GRAY)
+            tracker._follow_points(previous_gray, gray, points)
+
+        _report(f"flow hands={hands}", timeit.timeit(track, number=repeat), repeat)
+
+def bench_roi(repeat=30):
+    """Compare MediaPipe inference on the full frame with inference on a hand ROI
+
+    Frames are the photo at $HAND_BENCH_IMAGE if set, otherwise synthetic frames without a hand,
+    which time hand detection alone. ROI mode runs MediaPipe in static image mode (every crop is
+    searched on its own), and a hand it loses is searched for again on the full frame.
+    """
+    try:
+        import mediapipe as mp
+    except ImportError:
+        print("roi: MediaPipe is not installed, skipped")
+        return
+    image_path = os.environ.get('HAND_BENCH_IMAGE')
+    if image_path:
+        frame = cv2.imread(image_path)
+        if frame is None:
+            raise FileNotFoundError(f"Could not read the hand image {image_path}")
+        frame = cv2.resize(frame, (VIDEO_X, VIDEO_Y))
+    else:
+        noise = np.random.RandomState(0).randint(0, 256, (VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+        frame = cv2.GaussianBlur(noise, (15, 15), 5)
+    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+
+    def make_hands(static_image_mode):
+        return mp.solutions.hands.Hands(static_image_mode=static_image_mode, max_num_hands=MAX_NUM_HANDS,
+                                        model_complexity=MODEL_COMPLEXITY, min_detection_confidence=MIN_DETECTION_CONFIDENCE,
+                                        min_tracking_confidence=MIN_TRACKING_CONFIDENCE)
+
+    # The ROI is placed around the hand found on the full frame as in HandTracker._get_roi, or in the middle
+    detector = make_hands(True)
+    hands = detector.process(image).multi_hand_landmarks or []
+    if hands:
+        points = np.array([(landmark.x * VIDEO_X, landmark.y * VIDEO_Y) for landmark in hands[0].landmark])
+        (x0, y0), (x1, y1) = points.min(axis=0), points.max(axis=0)
+        side = max(max(x1 - x0, y1 - y0) * (1 + 2 * HAND_ROI_MARGIN), HAND_ROI_MIN_SIZE)
+        center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+    else:
+        side, center_x, center_y = HAND_ROI_MIN_SIZE, VIDEO_X / 2, VIDEO_Y / 2
+    roi_x0, roi_y0 = int(max(center_x - side / 2, 0)), int(max(center_y - side / 2, 0))
+    crop = np.ascontiguousarray(image[roi_y0:int(min(center_y + side / 2, VIDEO_Y)), roi_x0:int(min(center_x + side / 2, VIDEO_X))])
+
+    print(f"hand inference ({'hand found' if hands else 'no hand'} on the full frame, ROI {crop.shape[1]}x{crop.shape[0]})")
+    cases = (
+        # Full frame without ROIs: MediaPipe tracks the hand from frame to frame
+        ('full frame', make_hands(False), lambda: image),
+        # ROI mode after losing the hand: detection on the full frame
+        ('roi lost, full frame', detector, lambda: image),
+        ('roi', make_hands(True), lambda: crop),
+        ('roi x0.5 with resize', make_hands(True), lambda: cv2.resize(crop, None, fx=0.5, fy=0.5, interpolation=cv2.INTER_AREA)),
+    )
+    for name, model, get_image in cases:
+        # The first call sets up the graph
+        model.process(get_image())
+        _report(name, timeit.timeit(lambda: model.process(get_image()), number=repeat), repeat)
+        model.close()
+
+def _legacy_put_centered(image, text, y, scale, thickness, color):
+    """Measure and draw a line of end screen text with cv2.putText (kept for comparison)"""
+    (w, h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, scale, thickness)
+    x = max(int((VIDEO_X - w) / 2), 0)
+    y = min(y, VIDEO_Y - h)
+    cv2.putText(image, text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, scale, color, thickness, cv2.LINE_AA)
+    return y, h
+
+def _legacy_draw_hud(image, score, remaining_time):
+    """Score and timer drawn with cv2.getTextSize/putText every frame (kept for comparison)"""
+    for text, x_fraction in ((f'Score: {score}', 0.8), (f'{round(remaining_time, 2)} secs', None)):
+        (w, h), _ = cv2.getTextSize(text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, FONT_THICKNESS)
+        x = int(VIDEO_X * x_fraction) if x_fraction else int(VIDEO_X * 0.5 - w / 2)
+        cv2.putText(image, text, (min(max(x, 0), VIDEO_X - w - 20), max(int(VIDEO_Y * 0.1), h + 20)),
+                    cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, WHITE_TEXT, FONT_THICKNESS, cv2.LINE_AA)
+
+def _legacy_draw_victory(image, score, completion_time):
+    """Victory screen drawn with cv2.getTextSize/putText every frame (kept for comparison)"""
+    (w, h), _ = cv2.getTextSize('YOU WON!', cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, BOLD_FONT_THICKNESS)
+    x, y = min(max(int((VIDEO_X - w) / 2), 0), VIDEO_X - w), min(max(int(VIDEO_Y / 2), h), VIDEO_Y - h)
+    cv2.putText(image, 'YOU WON!', (x+3, y+3), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, (0,0,0), BOLD_FONT_THICKNESS+2, cv2.LINE_AA)
+    cv2.putText(image, 'YOU WON!', (x, y), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, GREEN_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA)
+    sy, sh = _legacy_put_centered(image, f'Your Score: {score}', y + h + 30, FONT_SCALE*2, BOLD_FONT_THICKNESS, WHITE_TEXT)
+    _legacy_put_centered(image, f'Time: {round(completion_time, 2)}s', sy + sh + 20, FONT_SCALE*2, BOLD_FONT_THICKNESS, WHITE_TEXT)
+
+def bench_hud(frames=300):
+    """Compare drawing the HUD and end screen with putText every frame against cached layouts and sprites"""
+    renderer = Renderer()
+    image = np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+    # In game the timer changes every frame and the score every 50 frames; the end screen never changes
+    remaining = np.linspace(GAME_DURATION, 0, frames)
+    cases = (
+        ("HUD", lambda frame: _legacy_draw_hud(image, frame // 50, remaining[frame]),
+                lambda frame: renderer.draw_ui(image, frame // 50, remaining[frame], False)),
+        ("victory screen", lambda frame: _legacy_draw_victory(image, 7, 12.34),
+                           lambda frame: renderer.draw_victory(image, 7, 12.34)),
+    )
+
+    for title, legacy, cached in cases:
+        print(title)
+        for name, draw in (("putText", legacy), ("cached", cached)):
+            run = lambda: [draw(frame) for frame in range(frames)]
+            run()
+            _report(name, timeit.timeit(run, number=3), 3 * frames)
+
+class _AllocationProfiler(FrameProfiler):
+    """Profiler that records the peak memory allocated inside each stage instead of its duration"""
+
+    @contextmanager
+    def span(self, name):
+        tracemalloc.reset_peak()
+        start = tracemalloc.get_traced_memory()[0]
+        try:
+            yield
+        finally:
+            allocated = tracemalloc.get_traced_memory()[1] - start
+            self.current[name] = self.current.get(name, 0) + allocated
+
+def _run_headless(profiler, frames, num_pucks, num_targets):
+    """Play a seeded headless game with offscreen rendering for a fixed number of frames"""
+    game = HeadlessGame(seed=0, renderer=Renderer(), num_pucks=num_pucks, num_targets=num_targets, profiler=profiler)
+    start = time.perf_counter()
+    for _ in range(frames):
+        game.step()
+    return game, time.perf_counter() - start
+
+def bench_simulation(frames=900):
+    """Headless throughput, per-stage frame time percentiles and allocations per frame"""
+    print("headless simulation")
+    for num_pucks, num_targets in ((1, NUM_TARGETS), (50, 64), (200, 512)):
+        print(f"  {num_pucks} pucks, {num_targets} targets, {frames} frames")
+        profiler = FrameProfiler(window=frames, export_path=None)
+        game, elapsed = _run_headless(profiler, frames, num_pucks, num_targets)
+        print(f"    {game.simulation.steps / elapsed:10.0f} physics steps/s, {frames / elapsed:8.0f} frames/s")
+
+        tracemalloc.start()
+        allocations = _AllocationProfiler(window=frames, export_path=None)
+        _run_headless(allocations, frames, num_pucks, num_targets)
+        tracemalloc.stop()
+
+        for stage, (p50, p95, p99) in profiler.get_percentiles().items():
+            if stage == 'frame':
+                continue
+            p50, p95, p99 = p50 * 1e3, p95 * 1e3, p99 * 1e3
+            allocated = np.mean(allocations.get_samples(stage)) / 1024
+            print(f"    {stage:<12} p50 {p50:7.3f} ms  p95 {p95:7.3f} ms  p99 {p99:7.3f} ms  {allocated:8.1f} KiB peak alloc/frame")
+
+# Kiosk sessions measured by the soak by default (python benchmark.py soak --soak-sessions N for longer runs)
+SOAK_SESSIONS = 200
+# Traced memory may grow by at most this much over the whole soak, however many sessions it runs
+SOAK_MAX_GROWTH = 16 * 1024
+# Measured sessions are split into this many windows, each reduced to its minimum, and a line is fitted to them
+SOAK_WINDOWS = 5
+
+class _SpotHands:
+    """Stand-in for the MediaPipe hand model: one hand, its fingertip at the brightest spot"""
+    def __init__(self):
+        self.channel = None
+
+    def process(self, image):
+        self.channel = cv2.extractChannel(image, 0, dst=self.channel)
+        _, brightest, _, (x, y) = cv2.minMaxLoc(self.channel)
+        if brightest < 128:
+            return HandResults(None, None)
+        height, width = image.shape[:2]
+        landmarks = [Landmark(x / width, y / height, 0.0)] * (INDEX_FINGER_TIP + 1)
+        return HandResults([HandLandmarks(landmarks)], [Handedness([Classification(1, 1.0, 'Right')])])
+
+    def close(self):
+        pass
+
+class _SpotTracker(HandTracker):
+    """HandTracker running _SpotHands instead of MediaPipe, so the tracking around the model runs as in the game"""
+    def _load_model(self):
+        self.hands = _SpotHands()
+        self._model_ready.set()
+
+@contextmanager
+def _no_window():
+    """Stub out the OpenCV window calls, which headless builds and CI machines do not have"""
+    imshow, wait_key, destroy_all_windows = cv2.imshow, cv2.waitKey, cv2.destroyAllWindows
+    cv2.imshow, cv2.waitKey, cv2.destroyAllWindows = lambda name, image: None, lambda delay: -1, lambda: None
+    try:
+        yield
+    finally:
+        cv2.imshow, cv2.waitKey, cv2.destroyAllWindows = imshow, wait_key, destroy_all_windows
+
+def bench_soak(sessions=SOAK_SESSIONS, warmup=50):
+    """Run the kiosk session manager through many short games and fail if traced memory keeps growing
+
+    The whole game loop runs as on a kiosk (threaded camera, async hand tracker, attract screen
+    with idle tracking, games started by holding up a hand, finished and abandoned games), on a
+    simulated clock so games take a fraction of their real time. A player's hand is a bright spot
+    on the synthetic frames, present for 4 of every 6 seconds.
+
+    Traced memory is sampled as each measured game starts. Whatever the capture and inference
+    threads hold at that moment varies, so each window of samples is reduced to its minimum.
+    Growth is the rise of a line fitted to the minimums of all windows over the measured sessions,
+    and must stay below SOAK_MAX_GROWTH in total, so a longer soak catches a smaller leak.
+    """
+    clock = SimulatedClock()
+    frame = np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+
+    def next_frame(index):
+        frame[:] = 0
+        if clock.now % 6 < 4:
+            x, y = sweep_trajectory(clock.now / 4)
+            cv2.circle(frame, (int(x), int(y)), 12, (255, 255, 255), -1)
+        return frame
+
+    # The game loop moves the clock a frame at a time
+    def advance_clock():
+        clock.advance(TARGET_FRAME_TIME)
+
+    # Stored in place so the samples do not add to what they measure
+    samples = np.zeros(sessions)
+    def sample(session):
+        if session > warmup:
+            gc.collect()
+            samples[session - warmup - 1] = tracemalloc.get_traced_memory()[0]
+
+    # Caches fill up during the warm-up sessions; traced from the start, so replaced entries are not counted as growth
+    tracemalloc.start()
+    # Line buffered, so game messages are not held in a buffer while memory is sampled
+    with _no_window(), open(os.devnull, 'w', buffering=1) as devnull, redirect_stdout(devnull):
+        # Capture is paced in real time so it does not starve the game loop
+        camera = Camera(source=SyntheticSource(next_frame, fps=1000), clock=clock)
+        manager = SessionManager(warmup + sessions, start_hold=0.5, end_screen_duration=0.5, abandon_timeout=1.0,
+                                 on_frame=advance_clock, on_session_start=sample,
+                                 camera=camera, hand_tracker=_SpotTracker(), clock=clock)
+        manager.game_state.game_duration = 2.0
+        # Games are seldom won in the warm-up; the end screens are cached once whatever the outcome
+        manager.renderer.draw_victory(frame, 0, 0.0)
+        manager.renderer.draw_game_over(frame, 0)
+
+        start = time.perf_counter()
+        manager.run()
+        elapsed = time.perf_counter() - start
+    tracemalloc.stop()
+
+    windows = np.array_split(samples, SOAK_WINDOWS)
+    window_minimums = np.array([window.min() for window in windows])
+    window_centers = np.array([indices.mean() for indices in np.array_split(np.arange(sessions), SOAK_WINDOWS)])
+    # Bytes per session, and over the whole run
+    slope = np.polyfit(window_centers, window_minimums, 1)[0]
+    growth = slope * sessions
+    tracker = manager.hand_tracker
+    print(f"soak ({manager.sessions} kiosk sessions, {warmup} of them warm-up)")
+    print(f"  {manager.sessions / elapsed:10.1f} sessions/s, {camera.captured_frames} frames captured, "
+          f"inference on {tracker.inferred_frames}, {tracker.skipped_frames} skipped")
+    print(f"  traced memory per window {' '.join(f'{minimum / 1024:.1f}' for minimum in window_minimums)} KiB, "
+          f"spread within windows up to {max(np.ptp(window) for window in windows) / 1024:.1f} KiB")
+    print(f"  memory growth {growth / 1024:8.1f} KiB ({slope:6.1f} bytes/session)")
+    if growth > SOAK_MAX_GROWTH:
+        raise SystemExit(f"soak: memory grew by {growth / 1024:.1f} KiB over {sessions} sessions "
+                         f"(at most {SOAK_MAX_GROWTH / 1024:.0f} KiB allowed)")
+
+def _legacy_frame_path(raw):
+    """Per-frame conversions before frame buffers were reused (kept for comparison)"""
+    frame = cv2.flip(raw, 1)
+    image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
+    # Copy handed to the async tracker, and the BGR image converted back for display
+    tracker_image = image.copy()
+    display_image = cv2.cvtColor(image, cv2.COLOR_RGB2BGR)
+    return tracker_image, display_image
+
+def bench_frame_path(repeat=300):
+    """Compare the frame conversions and copies per frame, in time and bytes allocated"""
+    raw = np.random.RandomState(0).randint(0, 256, (VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+    camera = Camera(source=SyntheticSource(lambda index: raw, fps=0), threaded=False)
+    rgb = np.empty_like(raw)
+
+    def current_frame_path():
+        # Flip into the camera's reused buffer, then the tracker's single BGR->RGB conversion
+        frame, _ = camera.read_frame()
+        cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=rgb)
+
+    print(f"frame path ({VIDEO_X}x{VIDEO_Y})")
+    for name, frame_path in (("legacy", lambda: _legacy_frame_path(raw)), ("reused", current_frame_path)):
+        frame_path()
+        seconds = timeit.timeit(frame_path, number=repeat)
+        tracemalloc.start()
+        frame_path()
+        allocated = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        print(f"  {name:<28} {seconds / repeat * 1e6:10.1f} us/frame {allocated / 1024:10.1f} KiB peak alloc/frame")
+    camera.release()
+
+def bench_outputs(frames=300):
+    """Game loop time per frame spent on a stream and a video file: encoded inline, or handed to the outputs"""
+    image = np.random.RandomState(0).randint(0, 256, (VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+    print(f"outputs (MJPEG stream + video file, {VIDEO_X}x{VIDEO_Y}, every frame)")
+    with tempfile.TemporaryDirectory() as directory:
+        writer = cv2.VideoWriter(os.path.join(directory, 'inline.mp4'), cv2.VideoWriter_fourcc(*VIDEO_FOURCC), 30, (VIDEO_X, VIDEO_Y))
+        def inline():
+            cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, MJPEG_QUALITY])
+            writer.write(image)
+        inline()
+        _report("inline encoding", timeit.timeit(inline, number=frames), frames)
+        writer.release()
+
+        # At the camera's frame rate, and flooded with frames faster than the encoders keep up with
+        for title, interval, count in (("queued outputs, 30 fps", 1 / 30, frames // 2), ("queued outputs, flooded", 0, frames)):
+            outputs = [MJPEGServer(port=0, fps=0), SegmentedVideoWriter(directory, fps=0)]
+            durations = []
+            for frame in range(count):
+                start = time.perf_counter()
+                for output in outputs:
+                    output.write(image, frame / 30)
+                durations.append(time.perf_counter() - start)
+                time.sleep(max(interval - (time.perf_counter() - start), 0))
+            for output in outputs:
+                output.close()
+            p50, p99 = np.percentile(durations, [50, 99]) * 1e6
+            print(f"  {title:<28} {np.mean(durations) * 1e6:10.1f} us/call (p50 {p50:.1f}, p99 {p99:.1f})")
+            for output in outputs:
+                print(f"    {type(output).__name__:<26} {output.written_frames} frames encoded, {output.dropped_frames} dropped")
+
+# Run by bench_startup in a fresh interpreter, so imports are really cold
+_STARTUP_SCRIPT = '''
+import sys, time
+sys.path.insert(0, {package_dir!r})
+
+def timed(name, action):
+    start = time.perf_counter()
+    result = action()
+    print(f"  {{name:<28}} {{(time.perf_counter() - start) * 1e3:10.1f}} ms")
+    return result
+
+print("imports")
+timed("numpy", lambda: __import__('numpy'))
+timed("cv2", lambda: __import__('cv2'))
+import config
+config.ASSET_CACHE_DIR = {cache_dir!r}
+timed("game modules", lambda: __import__('air_hockey_game'))
+from air_hockey_game import Camera, GameSimulation, HandTracker, Renderer
+from camera import SyntheticSource
+
+print("init")
+tracker = timed("HandTracker (returns)", HandTracker)
+camera = timed("Camera (synthetic)", lambda: Camera(source=SyntheticSource()))
+timed("Renderer (cold asset cache)", Renderer)
+timed("Renderer (warm asset cache)", Renderer)
+timed("GameSimulation", GameSimulation)
+try:
+    timed("hand model ready", tracker.wait_until_ready)
+except ImportError:
+    print("  hand model                   not installed")
+camera.release()
+tracker.close()
+'''
+
+def bench_startup():
+    """Time imports and component construction of a cold start, launched from another directory"""
+    package_dir = os.path.dirname(os.path.abspath(__file__))
+    with tempfile.TemporaryDirectory() as work_dir:
+        script = _STARTUP_SCRIPT.format(package_dir=package_dir, cache_dir=os.path.join(work_dir, 'cache'))
+        subprocess.run([sys.executable, '-c', script], cwd=work_dir, check=True)
+
+BENCHMARKS = {
+    'circle': bench_circle,
+    'targets': bench_targets,
+    'collisions': bench_collisions,
+    'pucks': bench_pucks,
+    'paddles': bench_paddles,
+    'filters': bench_filters,
+    'flow': bench_flow,
+    'roi': bench_roi,
+    'hud': bench_hud,
+    'simulation': bench_simulation,
+    'frame_path': bench_frame_path,
+    'soak': bench_soak,
+    'outputs': bench_outputs,
+    'startup': bench_startup,
+}
+
+def main():
+    """Run the benchmarks named on the command line (all by default)"""
+    parser = argparse.ArgumentParser(description="Micro-benchmarks for the game's hot paths")
+    parser.add_argument('names', nargs='*', help=f"benchmarks to run, from: {', '.join(BENCHMARKS)}")
+    parser.add_argument('--soak-sessions', type=int, default=SOAK_SESSIONS, help="kiosk sessions the soak measures")
+    args = parser.parse_args()
+    options = {'soak': {'sessions': args.soak_sessions}}
+    for name in args.names or list(BENCHMARKS):
+        if name not in BENCHMARKS:
+            print(f"Unknown benchmark '{name}', choose from: {', '.join(BENCHMARKS)}")
+            continue
+        BENCHMARKS[name](**options.get(name, {}))
+
+if __name__ == "__main__":
+    main()
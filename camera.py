@@ -1,31 +1,210 @@
 import cv2
+import threading
+import time
+import numpy as np
 from config import *
 
-class Camera:
-    def __init__(self, camera_index=0):
-        """Initialize camera capture"""
-        self.cap = cv2.VideoCapture(camera_index)
-        self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, VIDEO_X)
-        self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, VIDEO_Y)
+class VideoCaptureSource:
+    def __init__(self, source=0):
+        """Open a camera index or a video file with OpenCV"""
+        self.cap = cv2.VideoCapture(source)
+        self.is_file = isinstance(source, str)
+        self.frame_interval = 0
+        self.next_frame_time = None
+
+        if self.is_file:
+            # Play files back at their recorded rate instead of as fast as they decode
+            fps = self.cap.get(cv2.CAP_PROP_FPS)
+            self.frame_interval = 1.0 / fps if fps > 0 else 0
+        else:
+            self.cap.set(cv2.CAP_PROP_FRAME_WIDTH, VIDEO_X)
+            self.cap.set(cv2.CAP_PROP_FRAME_HEIGHT, VIDEO_Y)
+            # Keep the driver queue short so stale frames do not pile up
+            self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
 
         actual_width = self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)
         actual_height = self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)
         print(f"Actual resolution: {actual_width} x {actual_height}")
-        
-    def read_frame(self):
-        """Read a frame from the camera"""
-        success, frame = self.cap.read()
-        if not success:
-            return None, False
-        
+
+    def is_opened(self):
+        """Check if the capture device or file is open"""
+        return self.cap.isOpened()
+
+    def read(self, out=None):
+        """Read the next BGR frame (into `out` if it fits), or None when the source is exhausted"""
+        if self.frame_interval:
+            self.next_frame_time = _wait_until(self.next_frame_time, self.frame_interval)
+        success, frame = self.cap.read(out) if out is not None else self.cap.read()
+        return frame if success else None
+
+    def release(self):
+        """Release the capture device"""
+        self.cap.release()
+
+class SyntheticSource:
+    def __init__(self, frame_generator=None, fps=30, num_frames=None):
+        """Generate frames without a camera, e.g. for headless runs
+
+        `frame_generator(index)` returns a BGR frame; a blank frame is used by default
+        """
+        self.frame_generator = frame_generator or _blank_frame
+        self.frame_interval = 1.0 / fps if fps else 0
+        self.num_frames = num_frames
+        self.index = 0
+        self.next_frame_time = None
+
+    def is_opened(self):
+        """Synthetic sources are always available"""
+        return True
+
+    def read(self, out=None):
+        """Produce the next frame, or None after `num_frames` frames"""
+        if self.num_frames is not None and self.index >= self.num_frames:
+            return None
+        if self.frame_interval:
+            self.next_frame_time = _wait_until(self.next_frame_time, self.frame_interval)
+        frame = self.frame_generator(self.index)
+        self.index += 1
+        return frame
+
+    def release(self):
+        """Nothing to release"""
+        pass
+
+def _blank_frame(index):
+    """Default synthetic frame: plain black"""
+    return np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8)
+
+def _wait_until(next_frame_time, frame_interval):
+    """Sleep until the next frame is due and return the following deadline"""
+    now = time.time()
+    if next_frame_time is None or next_frame_time < now - frame_interval:
+        # First frame, or we fell far behind: restart the schedule from now
+        return now + frame_interval
+    if next_frame_time > now:
+        time.sleep(next_frame_time - now)
+    return next_frame_time + frame_interval
+
+class Camera:
+    def __init__(self, camera_index=0, source=None, threaded=THREADED_CAPTURE, clock=time.time):
+        """Initialize camera capture
+
+        `source` can be any object with is_opened/read/release, e.g. a SyntheticSource, and
+        `clock` timestamps the frames
+        """
+        self.source = source if source is not None else VideoCaptureSource(camera_index)
+        self.threaded = threaded
+        self.clock = clock
+
+        # Capture time of the frame last returned by read_frame
+        self.frame_timestamp = None
+        # Frames captured, and frames overwritten before the game loop read them
+        self.captured_frames = 0
+        self.dropped_frames = 0
+
+        # Flipped frames are written into a small pool of reused buffers instead of new arrays:
+        # one being written by the capture thread, the newest frame, and the game loop's frame.
+        # Threaded capture allocates all three when the first frame arrives, not when a thread first runs short.
+        self._free_buffers = []
+        self._held_buffer = None
+        # Raw frame buffer, reused by sources that support reading into one
+        self._raw = None
+
+        self._latest = None
+        self._ended = False
+        self._running = False
+        self._frame_ready = threading.Condition()
+        self._thread = None
+
+        if self.threaded and self.source.is_opened():
+            self._running = True
+            self._thread = threading.Thread(target=self._capture_loop, name='camera-capture', daemon=True)
+            self._thread.start()
+
+    def is_opened(self):
+        """Check if the frame source is open"""
+        return self.source.is_opened()
+
+    def _grab(self, out):
+        """Read one frame from the source and flip it into `out`, returning (frame, timestamp)"""
+        self._raw = self.source.read(self._raw)
+        timestamp = self.clock()
+        if self._raw is None:
+            return None, timestamp
+        if out is None or out.shape != self._raw.shape:
+            out = np.empty_like(self._raw)
         # Flip frame horizontally for selfie view
-        frame = cv2.flip(frame, 1)
+        return cv2.flip(self._raw, 1, dst=out), timestamp
+
+    def _capture_loop(self):
+        """Keep only the newest frame, so the game never processes a stale one"""
+        try:
+            self._capture_frames()
+        finally:
+            # However capture stops, a game loop waiting for a frame must not wait forever
+            with self._frame_ready:
+                self._ended = True
+                self._frame_ready.notify_all()
+
+    def _capture_frames(self):
+        """Capture until released or the source is exhausted"""
+        while self._running:
+            with self._frame_ready:
+                buffer = self._free_buffers.pop() if self._free_buffers else None
+            frame, timestamp = self._grab(buffer)
+            with self._frame_ready:
+                if frame is None:
+                    return
+                if self.captured_frames == 0:
+                    self._free_buffers.extend(np.empty_like(frame) for _ in range(2))
+                if self._latest is not None:
+                    # The game loop never saw this frame; its buffer can be reused
+                    self.dropped_frames += 1
+                    self._free_buffers.append(self._latest[0])
+                self._latest = (frame, timestamp)
+                self.captured_frames += 1
+                self._frame_ready.notify_all()
+
+    def read_frame(self):
+        """Read a frame from the camera
+
+        The frame stays valid (and may be drawn on) until the next call
+        """
+        if not self.threaded:
+            frame, timestamp = self._grab(self._held_buffer)
+            if frame is None:
+                return None, False
+            self._held_buffer = frame
+            self.captured_frames += 1
+            self.frame_timestamp = timestamp
+            return frame, True
+
+        # Wait for a frame newer than the one returned last time. Only the end of the source ends
+        # the stream; a camera that stalls for a while (USB hiccup, slow start) is waited for.
+        with self._frame_ready:
+            while not self._frame_ready.wait_for(lambda: self._latest is not None or self._ended, timeout=CAPTURE_TIMEOUT):
+                print(f"No camera frame for {CAPTURE_TIMEOUT}s, still waiting")
+            if self._latest is None:
+                return None, False
+            frame, self.frame_timestamp = self._latest
+            self._latest = None
+            # The previous frame is done with, so the capture thread may write into it again
+            if self._held_buffer is not None:
+                self._free_buffers.append(self._held_buffer)
+            self._held_buffer = frame
         return frame, True
-    
-    def convert_to_rgb(self, frame):
-        """Convert BGR frame to RGB"""
-        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB)
-    
-    def convert_to_bgr(self, frame):
-        """Convert RGB frame to BGR for display"""
-        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR)
\ No newline at end of file
+
+    def release(self):
+        """Stop the capture thread and release the frame source"""
+        self._running = False
+        if self._thread is not None:
+            self._thread.join(timeout=CAPTURE_TIMEOUT)
+        self.source.release()
+
+    def convert_to_rgb(self, frame, dst=None):
+        """Convert BGR frame to RGB (into `dst` if given)"""
+        return cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=dst)
+
+    def convert_to_bgr(self, frame, dst=None):
+        """Convert RGB frame to BGR for display (into `dst` if given)"""
+        return cv2.cvtColor(frame, cv2.COLOR_RGB2BGR, dst=dst)
@@ -1,22 +1,48 @@
 """Game Configuration Constants"""
 
+import os
+
+# Assets are found next to the code, whatever directory the game is started from
+PACKAGE_DIR = os.path.dirname(os.path.abspath(__file__))
+ASSET_CACHE_DIR = os.path.join(PACKAGE_DIR, '.cache')  # Preprocessed assets; None disables the cache
+
 # Video dimensions
 VIDEO_X, VIDEO_Y = 640, 480
 
+# Camera capture settings
+THREADED_CAPTURE = True  # Capture on a background thread that keeps only the newest frame
+CAPTURE_TIMEOUT = 1.0  # seconds without a frame before warning that the camera stalled (it is still waited for)
+
 # Target settings
 TARGET_SIZE = 30
+TARGET_IMAGE_PATH = os.path.join(PACKAGE_DIR, 'target.png')
 NUM_TARGETS = 4
+TARGET_GRID_CELL_SIZE = 64  # pixels, cell size of the spatial index used for target hit tests
+BATCH_BLEND_MIN_TARGETS = 8  # Blend targets in one batch from this many active targets
 
 # Game settings
 GAME_DURATION = 30  # seconds
 
 # Physics settings
-INITIAL_PUCK_VELOCITY = [10, 10]
+PHYSICS_DT = 1 / 120  # seconds of simulated time per physics step
+MAX_PHYSICS_STEPS = 8  # Cap on steps per rendered frame, so one slow frame cannot snowball
+PHYSICS_REFERENCE_FPS = 30  # Frame rate the per-frame puck velocity below was tuned at
+PADDLE_RESTITUTION = 1.0  # Fraction of the approach speed the puck keeps when bouncing off the paddle
+MAX_PUCK_SPEED = 1200  # pixels per second, caps the speed a fast paddle can give the puck
+NUM_PUCKS = 1
+INITIAL_PUCK_VELOCITY = [10, 10]  # pixels per frame at PHYSICS_REFERENCE_FPS
 INCREASE_SPEED_FACTOR = 1
 PUCK_RADIUS = 12
-PUCK_SMOOTHING_FACTOR = 0.7
+PUCK_SMOOTHING_FACTOR = 0.7  # Scales the puck's displacement per frame
 PADDLE_RADIUS = 16
 PADDLE_SMOOTHING_FACTOR = 0.90
+PADDLE_FILTER = 'exponential'  # Paddle estimator: 'exponential' (PADDLE_SMOOTHING_FACTOR), 'one_euro' or 'kalman'
+ONE_EURO_MIN_CUTOFF = 1.0  # Hz, cutoff of the One Euro filter at rest (lower is smoother)
+ONE_EURO_BETA = 0.05  # Cutoff increase per pixel/sec of speed (higher lags less when fast)
+ONE_EURO_D_CUTOFF = 10.0  # Hz, cutoff of the One Euro filter's velocity estimate
+KALMAN_PROCESS_NOISE = 2e6  # pixels^2/s^3, how freely the hand may accelerate
+KALMAN_MEASUREMENT_NOISE = 4.0  # pixels^2, variance of the fingertip measurement
+KALMAN_INITIAL_VELOCITY_VARIANCE = 1e6  # (pixels/sec)^2, uncertainty of a newly seen hand's velocity
 
 # Text
 FONT_SCALE = 0.75
@@ -32,9 +58,62 @@ SEMI_TRANSPARENT_BLACK = (0, 0, 0, 128)  # For overlay backgrounds (if needed)
 # Colors (BGR format for OpenCV)
 PUCK_COLOR = [255, 0, 0]  # Blue
 PADDLE_COLOR = [0, 255, 0]  # Green
+# One color per player; the first player keeps PADDLE_COLOR
+PADDLE_COLORS = [PADDLE_COLOR, [0, 0, 255], [0, 255, 255], [255, 0, 255]]  # Green, red, yellow, magenta
+
+# Profiling settings
+PROFILING_ENABLED = False  # Time every stage of the main loop
+PROFILE_OVERLAY = True  # Draw the stage percentiles on screen while profiling ('p' toggles)
+PROFILE_OVERLAY_REFRESH = 0.5  # seconds between overlay updates
+PROFILE_WINDOW = 300  # frames kept for the rolling percentiles
+PROFILE_EXPORT_PATH = None  # e.g. 'profile.jsonl' or 'profile.csv' to export percentiles
+PROFILE_EXPORT_INTERVAL = 5.0  # seconds between exports
 
 # Hand tracking settings
-MAX_NUM_HANDS = 1
+MAX_NUM_HANDS = 1  # Players: one paddle per tracked hand
 MODEL_COMPLEXITY = 1
 MIN_DETECTION_CONFIDENCE = 0.5
-MIN_TRACKING_CONFIDENCE = 0.5
\ No newline at end of file
+MIN_TRACKING_CONFIDENCE = 0.5
+HAND_MATCH_DISTANCE = 150  # pixels, farthest a fingertip can move between results and keep its player
+HAND_ID_TIMEOUT = 1.0  # seconds a lost hand keeps its player slot before a new hand may take it
+HAND_TRACKING_MODE = 'async'  # 'async' runs inference on a worker thread, 'sync' on the game loop
+LATENCY_COMPENSATION = True  # Extrapolate the fingertip from its capture time to the current frame
+MAX_PREDICTION_TIME = 0.1  # seconds, upper bound on how far the fingertip is extrapolated
+FINGERTIP_VELOCITY_SMOOTHING = 0.5  # Weight of the newest sample in the fingertip velocity estimate
+ADAPTIVE_INFERENCE = True  # Skip inference on some frames when it is slow or the hands are still
+TARGET_FRAME_TIME = 1 / 30  # seconds, frame time the inference scheduler aims to keep
+INFERENCE_BUDGET = 0.5  # Largest average share of the target frame time spent on inference
+INFERENCE_MAX_INTERVAL = 6  # Run inference at least every this many frames
+INFERENCE_MOTION_TOLERANCE = 12  # pixels a fingertip may move between inferences
+INFERENCE_SKIP_MODE = 'flow'  # On skipped frames: 'flow' follows fingertips with optical flow, 'extrapolate' reuses the last result
+FLOW_WINDOW_SIZE = 21  # pixels, Lucas-Kanade search window
+FLOW_PYRAMID_LEVELS = 3  # Pyramid levels for optical flow, so fast motion is still found
+FLOW_MAX_ERROR = 20  # Mean absolute pixel difference of a followed patch above which the fingertip is lost
+FLOW_MAX_BACKTRACK_ERROR = 2.0  # pixels, farthest flowing a fingertip back may land from where it started
+IDLE_INFERENCE_INTERVAL = 0.5  # seconds between inferences while idle (attract screen), to save CPU
+HAND_ROI_ENABLED = False  # Run inference only on a region around the last detected hand; measure with `python benchmark.py roi`
+HAND_ROI_MARGIN = 0.75  # ROI margin on each side, as a fraction of the hand's landmark box size
+HAND_ROI_MIN_SIZE = 160  # pixels, smallest ROI side so a fast hand is not lost
+HAND_ROI_DOWNSCALE = 1.0  # Scale applied to the ROI before inference (< 1 trades accuracy for speed)
+
+# Recording and replay settings
+RECORD_PATH = None  # e.g. 'session.trk' to record hand tracking results while playing
+REPLAY_PATH = None  # Play back a recording instead of using the camera and MediaPipe
+
+# Output settings (besides the local window), e.g. for a spectator screen or to record games
+OUTPUT_SINKS = []  # Any of 'mjpeg' (stream over HTTP) and 'video' (segmented video files)
+OUTPUT_SIZE = None  # (width, height) outputs are scaled to; None keeps the game's resolution
+OUTPUT_FPS = 15  # Highest frame rate of the outputs; 0 takes every game frame
+OUTPUT_QUEUE_SIZE = 4  # Frames waiting for an encoder; beyond this the oldest is dropped
+MJPEG_HOST = '127.0.0.1'  # '0.0.0.0' to let other machines watch
+MJPEG_PORT = 8080
+MJPEG_QUALITY = 80  # JPEG quality, 0-100
+VIDEO_OUTPUT_DIR = 'videos'
+VIDEO_SEGMENT_SECONDS = 300  # A new video file is started this often
+VIDEO_FOURCC = 'mp4v'  # 'mp4v' writes .mp4 files, 'MJPG' .avi files
+
+# Kiosk settings
+KIOSK_MODE = False  # run_game.py plays game after game, with an attract screen in between, until 'q'
+SESSION_START_HOLD = 1.0  # seconds a hand must be held up on the attract screen to start a game
+END_SCREEN_DURATION = 10.0  # seconds the result is shown before returning to the attract screen
+SESSION_ABANDON_TIMEOUT = 10.0  # seconds without a tracked hand after which a game is abandoned
\ No newline at end of file
@@ -0,0 +1,158 @@
+"""
+Paddle state estimators
+
+Each filter tracks a set of 2D points (one per paddle) from noisy fingertip
+measurements and reports a float position and velocity for every point, plus a
+prediction for any timestamp. All points are updated in one vectorized call at
+O(1) cost per sample.
+"""
+
+import numpy as np
+from config import *
+
+class ExponentialFilter:
+    # The velocity is only a finite difference of the lagging output, not a model estimate
+    models_velocity = False
+
+    def __init__(self, initial_positions, smoothing=PADDLE_SMOOTHING_FACTOR):
+        """Fixed per-sample blend towards the measurement (the original paddle smoothing)"""
+        self.smoothing = smoothing
+        self.positions = np.array(initial_positions, dtype=float)
+        self.velocities = np.zeros_like(self.positions)
+        # Time of the last measurement of each point
+        self.times = np.full(len(self.positions), np.nan)
+
+    def update(self, measurements, tracked, timestamp):
+        """Add a measurement for the points in the `tracked` mask, all taken at `timestamp`"""
+        previous = self.positions[tracked]
+        self.positions[tracked] = previous * (1 - self.smoothing) + measurements[tracked] * self.smoothing
+        elapsed = timestamp - self.times[tracked]
+        moving = (elapsed > 0)[:, None]
+        self.velocities[tracked] = np.where(moving, (self.positions[tracked] - previous) / np.where(moving, elapsed[:, None], 1), 0)
+        self.times[tracked] = timestamp
+
+    def reset(self, points):
+        """Forget the motion of the points in the `points` mask, e.g. when their hand is lost
+
+        Their next measurement starts them afresh instead of being integrated across the gap
+        """
+        self.times[points] = np.nan
+        self.velocities[points] = 0
+
+    def predict(self, timestamp):
+        """Positions extrapolated to `timestamp`"""
+        elapsed = np.nan_to_num(timestamp - self.times)
+        return self.positions + self.velocities * elapsed[:, None]
+
+class OneEuroFilter(ExponentialFilter):
+    models_velocity = True
+
+    def __init__(self, initial_positions, min_cutoff=ONE_EURO_MIN_CUTOFF, beta=ONE_EURO_BETA, d_cutoff=ONE_EURO_D_CUTOFF):
+        """One Euro filter (Casiez et al. 2012): smooth when slow, little lag when fast
+
+        The cutoff frequency grows with the filtered speed: min_cutoff + beta * speed
+        """
+        super().__init__(initial_positions)
+        self.min_cutoff = min_cutoff
+        self.beta = beta
+        self.d_cutoff = d_cutoff
+
+    @staticmethod
+    def _alpha(cutoff, elapsed):
+        """Blend factor of a first-order low-pass filter with the given cutoff (Hz) over `elapsed` seconds"""
+        tau = 1 / (2 * np.pi * cutoff)
+        return 1 / (1 + tau / elapsed)
+
+    def update(self, measurements, tracked, timestamp):
+        first = tracked & np.isnan(self.times)
+        # The first sample of a point is taken as is
+        self.positions[first] = measurements[first]
+        self.times[first] = timestamp
+
+        updating = tracked & (timestamp > self.times)
+        if not updating.any():
+            return
+        elapsed = (timestamp - self.times[updating])[:, None]
+        previous = self.positions[updating]
+        measured = measurements[updating]
+
+        # Low-pass the raw velocity, then use its speed to pick the position cutoff
+        raw_velocity = (measured - previous) / elapsed
+        velocity = self.velocities[updating]
+        velocity += self._alpha(self.d_cutoff, elapsed) * (raw_velocity - velocity)
+        cutoff = self.min_cutoff + self.beta * np.linalg.norm(velocity, axis=1, keepdims=True)
+        self.positions[updating] = previous + self._alpha(cutoff, elapsed) * (measured - previous)
+        self.velocities[updating] = velocity
+        self.times[updating] = timestamp
+
+class KalmanFilter(ExponentialFilter):
+    models_velocity = True
+
+    def __init__(self, initial_positions, process_noise=KALMAN_PROCESS_NOISE, measurement_noise=KALMAN_MEASUREMENT_NOISE):
+        """Constant-velocity Kalman filter driven by white-noise acceleration
+
+        x and y are filtered independently with the same noise, so both axes of a point
+        share one 2x2 covariance, stored as its three distinct entries
+        """
+        super().__init__(initial_positions)
+        self.process_noise = process_noise
+        self.measurement_noise = measurement_noise
+        count = len(self.positions)
+        # Position variance, position-velocity covariance and velocity variance of each point
+        self.p00 = np.zeros(count)
+        self.p01 = np.zeros(count)
+        self.p11 = np.zeros(count)
+
+    def reset(self, points):
+        super().reset(points)
+        self.p00[points] = 0
+        self.p01[points] = 0
+        self.p11[points] = 0
+
+    def update(self, measurements, tracked, timestamp):
+        first = tracked & np.isnan(self.times)
+        # The first sample of a point is taken as is, with an unknown velocity
+        self.positions[first] = measurements[first]
+        self.velocities[first] = 0
+        self.p00[first] = self.measurement_noise
+        self.p01[first] = 0
+        self.p11[first] = KALMAN_INITIAL_VELOCITY_VARIANCE
+        self.times[first] = timestamp
+
+        updating = tracked & (timestamp > self.times)
+        if not updating.any():
+            return
+        dt = timestamp - self.times[updating]
+        q = self.process_noise
+        p00, p01, p11 = self.p00[updating], self.p01[updating], self.p11[updating]
+
+        # Predict: x += v dt, P = F P F^T + Q
+        positions = self.positions[updating] + self.velocities[updating] * dt[:, None]
+        velocities = self.velocities[updating]
+        p00 = p00 + 2 * dt * p01 + dt ** 2 * p11 + q * dt ** 3 / 3
+        p01 = p01 + dt * p11 + q * dt ** 2 / 2
+        p11 = p11 + q * dt
+
+        # Correct with the measured position
+        innovation = measurements[updating] - positions
+        gain_position = p00 / (p00 + self.measurement_noise)
+        gain_velocity = p01 / (p00 + self.measurement_noise)
+        self.positions[updating] = positions + gain_position[:, None] * innovation
+        self.velocities[updating] = velocities + gain_velocity[:, None] * innovation
+        self.p11[updating] = p11 - gain_velocity * p01
+        self.p00[updating] = (1 - gain_position) * p00
+        self.p01[updating] = (1 - gain_position) * p01
+        self.times[updating] = timestamp
+
+PADDLE_FILTERS = {
+    'exponential': ExponentialFilter,
+    'one_euro': OneEuroFilter,
+    'kalman': KalmanFilter,
+}
+
+def make_paddle_filter(initial_positions, kind=PADDLE_FILTER):
+    """Paddle state estimator selected by PADDLE_FILTER"""
+    if kind not in PADDLE_FILTERS:
+        print(f"Unknown paddle filter '{kind}', using exponential smoothing")
+        kind = 'exponential'
+    return PADDLE_FILTERS[kind](initial_positions)
@@ -1,103 +1,326 @@
 import cv2
+import time
 import numpy as np
 from config import *
+from filters import make_paddle_filter
+from spatial import UniformGrid
 
-class Puck:
-    def __init__(self):
-        """Initialize puck at center of screen"""
-        self.position = np.array([VIDEO_X/2, VIDEO_Y/2]).astype(int)
-        self.velocity = np.array(INITIAL_PUCK_VELOCITY)
+class PuckSet:
+    def __init__(self, num_pucks=NUM_PUCKS, rng=np.random, initial_velocity=INITIAL_PUCK_VELOCITY,
+                 smoothing_factor=PUCK_SMOOTHING_FACTOR, speed_factor=INCREASE_SPEED_FACTOR):
+        """Initialize all pucks as rows of (num_pucks * 2) position and velocity arrays
+
+        The speed settings default to their values in config.py
+        """
+        self.count = num_pucks
         self.radius = PUCK_RADIUS
+        self.initial_velocity = initial_velocity
+        self.smoothing_factor = smoothing_factor
+        self.speed_factor = speed_factor
+        self.positions = np.empty((num_pucks, 2))
+        # Positions before the last physics step, for interpolating render positions
+        self.previous_positions = np.empty((num_pucks, 2))
+        self.velocities = np.empty((num_pucks, 2))
+        self.reset(rng)
+    
+    def reset(self, rng=np.random):
+        """Put the pucks back at their starting positions and speeds, in place"""
+        # The first puck starts at the center of the screen, any others at random free spots
+        self.positions[0] = [VIDEO_X/2, VIDEO_Y/2]
+        margin = self.radius + 1
+        self.positions[1:] = rng.uniform([margin, margin], [VIDEO_X - margin, VIDEO_Y - margin], size=(self.count - 1, 2))
+        self.previous_positions[:] = self.positions
         
-    def update_position(self):
-        """Update puck position based on velocity and time"""
-        # Create new_pos using current position and velocity
-        new_pos = np.array(self.position + self.velocity)
-        # Smoothen the displacement so that the movement does not appear discrete
-        new_pos[0] = (self.position[0] * (1 - PUCK_SMOOTHING_FACTOR) + new_pos[0] * PUCK_SMOOTHING_FACTOR)
-        new_pos[1] = (self.position[1] * (1 - PUCK_SMOOTHING_FACTOR) + new_pos[1] * PUCK_SMOOTHING_FACTOR)
+        # Pixels per second. The old per-frame update moved the puck by
+        # PUCK_SMOOTHING_FACTOR * velocity, so that scale is folded in here.
+        initial_velocity = np.array(self.initial_velocity, dtype=float) * self.smoothing_factor * PHYSICS_REFERENCE_FPS
+        # Every puck gets the initial speed; pucks after the first head in random directions
+        angles = rng.uniform(0, 2 * np.pi, size=self.count - 1)
+        self.velocities[0] = initial_velocity
+        self.velocities[1:] = np.linalg.norm(initial_velocity) * np.stack([np.cos(angles), np.sin(angles)], axis=1)
+    
+    def __len__(self):
+        """Number of pucks"""
+        return self.count
+    
+    def __getitem__(self, index):
+        """Single puck view of one row"""
+        return Puck(self, index)
+        
+    def update_positions(self, dt):
+        """Advance every puck by one physics step of `dt` seconds"""
+        self.previous_positions[:] = self.positions
+        self.positions += self.velocities * dt
+    
+    def get_render_positions(self, alpha):
+        """Interpolate between the last two physics steps (alpha = 0 is the previous step)"""
+        return self.previous_positions + (self.positions - self.previous_positions) * alpha
+    
+    # Acts as a dummy function when factor = 1
+    def increase_velocity(self, factor=None):
+        """Increase every puck's velocity by given factor (the set's speed factor by default)"""
+        self.velocities *= self.speed_factor if factor is None else factor
 
-        self.position = new_pos.astype(int)
+class Puck:
+    def __init__(self, pucks=None, index=0):
+        """View of one puck in a PuckSet (a set of its own by default)"""
+        self.pucks = pucks if pucks is not None else PuckSet(1)
+        self.index = index
+        self.radius = self.pucks.radius
+    
+    # Rows are returned as views, so in-place updates like puck.position[0] = x write through
+    @property
+    def position(self):
+        """Center of the puck"""
+        return self.pucks.positions[self.index]
+    
+    @position.setter
+    def position(self, value):
+        self.pucks.positions[self.index] = value
+    
+    @property
+    def previous_position(self):
+        """Center of the puck before the last physics step"""
+        return self.pucks.previous_positions[self.index]
+    
+    @previous_position.setter
+    def previous_position(self, value):
+        self.pucks.previous_positions[self.index] = value
+    
+    @property
+    def velocity(self):
+        """Velocity of the puck in pixels per second"""
+        return self.pucks.velocities[self.index]
+    
+    @velocity.setter
+    def velocity(self, value):
+        self.pucks.velocities[self.index] = value
+        
+    def update_position(self, dt):
+        """Advance the puck by one physics step of `dt` seconds"""
+        self.previous_position = self.position
+        self.position = self.position + self.velocity * dt
+    
+    def get_render_position(self, alpha):
+        """Interpolate between the last two physics steps (alpha = 0 is the previous step)"""
+        return self.previous_position + (self.position - self.previous_position) * alpha
     
     # Acts as a dummy function when factor = 1
-    def increase_velocity(self, factor=INCREASE_SPEED_FACTOR):
-        """Increase puck velocity by given factor"""
-        self.velocity *= factor
+    def increase_velocity(self, factor=None):
+        """Increase puck velocity by given factor (the set's speed factor by default)"""
+        self.velocity *= self.pucks.speed_factor if factor is None else factor
 
-class Paddle:
-    def __init__(self):
-        """Initialize paddle at random position"""
+class PaddleSet:
+    def __init__(self, num_paddles=MAX_NUM_HANDS, estimator=None):
+        """Initialize one paddle per player as rows of (num_paddles * 2) position arrays
+
+        Fingertip measurements go through `estimator` (see filters.py), PADDLE_FILTER by default
+        """
+        self.count = num_paddles
         self.radius = PADDLE_RADIUS
-        self.position = tuple((self.radius + 5, self.radius + 5))
+        self.positions = np.empty((num_paddles, 2))
+        # Positions the last physics step ended at; paddles are swept from here to `positions`
+        self.previous_positions = np.empty((num_paddles, 2))
+        # Estimated velocities in pixels per second, zero for paddles whose hand is not tracked
+        self.velocities = np.zeros((num_paddles, 2))
+        self.tracked = np.zeros(num_paddles, dtype=bool)
+        self.low = self.radius + 1
+        self.high = np.array([VIDEO_X - self.radius - 1, VIDEO_Y - self.radius - 1])
+        self.reset(estimator)
+    
+    def reset(self, estimator=None):
+        """Put the paddles back at their starting positions, with a fresh estimator unless one is given"""
+        # Paddles start spread along the top edge, the first one in the top-left corner
+        start = self.radius + 5
+        self.positions[:, 0] = start + np.arange(self.count) * (VIDEO_X - 2 * start) / max(self.count - 1, 1)
+        self.positions[:, 1] = start
+        self.previous_positions[:] = self.positions
+        self.velocities[:] = 0
+        self.tracked[:] = False
+        self.estimator = estimator if estimator is not None else make_paddle_filter(self.positions)
+    
+    def __len__(self):
+        """Number of paddles"""
+        return self.count
+    
+    def __getitem__(self, index):
+        """Single paddle view of one row"""
+        return Paddle(self, index)
+    
+    def update_positions(self, new_positions, timestamp=None):
+        """Move the paddles towards `new_positions`, one position per paddle or None if its hand is not tracked
+
+        `timestamp` is when the positions were measured (now by default)
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        targets = np.array([position if position is not None else (np.nan, np.nan) for position in new_positions], dtype=float)
+        tracked = ~np.isnan(targets[:, 0])
+        # A hand that was lost (or a new player taking over its slot) starts with a fresh estimate
+        self.estimator.reset(self.tracked & ~tracked)
+        found = tracked & ~self.tracked
+        self.tracked = tracked
+        # Smoothen the motion so that it does not appear discrete; untracked paddles stay where they are
+        self.estimator.update(np.clip(targets, self.low, self.high), self.tracked, timestamp)
+        # Keep the paddles within bounds
+        self.positions[self.tracked] = np.clip(self.estimator.positions[self.tracked], self.low, self.high)
+        self.velocities[:] = np.where(self.tracked[:, None], self.estimator.velocities, 0)
+        # A paddle whose hand was just found jumps to it: that jump is not a swing, so it is
+        # neither swept through the pucks nor given a velocity
+        self.previous_positions[found] = self.positions[found]
+        self.velocities[found] = 0
+    
+    def get_swept_positions(self, fraction):
+        """Interpolate from the positions at the last physics step (0) to the current ones (1)"""
+        return self.previous_positions + (self.positions - self.previous_positions) * fraction
+
+class Paddle:
+    def __init__(self, paddles=None, index=0):
+        """View of one paddle in a PaddleSet (a set of its own by default)"""
+        self.paddles = paddles if paddles is not None else PaddleSet(1)
+        self.index = index
+        self.radius = self.paddles.radius
+    
+    @property
+    def position(self):
+        """Center of the paddle"""
+        return self.paddles.positions[self.index]
+    
+    @position.setter
+    def position(self, value):
+        self.paddles.positions[self.index] = value
+    
+    @property
+    def previous_position(self):
+        """Center of the paddle at the last physics step"""
+        return self.paddles.previous_positions[self.index]
+    
+    @previous_position.setter
+    def previous_position(self, value):
+        self.paddles.previous_positions[self.index] = value
+        
+    @property
+    def velocity(self):
+        """Estimated velocity of the paddle in pixels per second"""
+        return self.paddles.velocities[self.index]
         
-    def update_position(self, new_position):
+    def update_position(self, new_position, timestamp=None):
         """Update paddle position"""
-        # Check if paddle is within bounds
-        if new_position:
-            # Convert new_position to numpy array if it's a tuple
-            new_pos = np.array(new_position)
-            # Smoothen the displacement so that the movement does not appear discrete
-            new_pos[0] = (self.position[0] * (1 - PADDLE_SMOOTHING_FACTOR) + new_pos[0] * PADDLE_SMOOTHING_FACTOR)
-            new_pos[1] = (self.position[1] * (1 - PADDLE_SMOOTHING_FACTOR) + new_pos[1] * PADDLE_SMOOTHING_FACTOR)
-
-            # Check if paddle is within bounds
-            new_pos[0] = max(self.radius + 1, min(new_pos[0], VIDEO_X - self.radius - 1))
-            new_pos[1] = max(self.radius + 1, min(new_pos[1], VIDEO_Y - self.radius - 1))
-            
-            # Apply smoothing
-            self.position = new_pos.astype(int)
+        new_positions = [None] * self.paddles.count
+        new_positions[self.index] = new_position
+        self.paddles.update_positions(new_positions, timestamp)
+    
+    def get_swept_position(self, fraction):
+        """Interpolate from the position at the last physics step (0) to the current one (1)"""
+        return self.previous_position + (self.position - self.previous_position) * fraction
         
 
 class Target:
-    def __init__(self, position):
-        """Initialize target at given position"""
-        self.position = position
-        self.hit = False
-        self.size = TARGET_SIZE
+    def __init__(self, manager, index):
+        """Thin view of one target stored in a TargetManager's arrays"""
+        self.manager = manager
+        self.index = index
+    
+    @property
+    def position(self):
+        """Top-left corner of the target"""
+        return self.manager.positions[self.index]
+    
+    @property
+    def size(self):
+        """Side length of the target"""
+        return self.manager.sizes[self.index]
+    
+    @property
+    def hit(self):
+        """Whether the target has been hit"""
+        return bool(self.manager.hit[self.index])
         
     def is_hit(self, puck):
         """Check if puck is within acceptance region of target"""
-        target_center = np.array(self.position) + self.size // 2
-        
-        # dxy : [dx, dy]
-        dxy = abs(target_center - puck.position)
-        # [dx - side / 2, dy - side / 2]
-        dsx, dsy = dxy - self.size // 2
-
-        # Calculate the puck's nearest distance from the target's boundary
-        db = np.sqrt(max(0, dsx) ** 2 + max(0, dsy) ** 2)
-        # Calculate the distance between the 2 centers
-        distance = np.linalg.norm(puck.position - target_center)
-
-        return db <= puck.radius or distance < self.size // 2
+        return bool(self.manager.hit_test(np.array([self.index]), puck.position[None], puck.radius)[0, 0])
 
 class TargetManager:
-    def __init__(self):
-        """Initialize target manager with random target positions"""
-        self.targets = []
+    def __init__(self, num_targets=NUM_TARGETS, rng=np.random, target_size=TARGET_SIZE):
+        """Initialize target manager with random target positions
+
+        `rng` is np.random by default; pass a seeded np.random.RandomState for a reproducible layout
+        """
+        self.num_targets = num_targets
+        self.rng = rng
+        self.target_size = target_size
+        # Index of the targets that are still active, keyed by their position in the arrays
+        self.grid = UniformGrid(TARGET_GRID_CELL_SIZE)
+        self._initialize_targets()
+    
+    def reset(self):
+        """Lay out a new random set of targets"""
+        self.grid.clear()
         self._initialize_targets()
         
     def _initialize_targets(self):
         """Create random target positions"""
-        # Creates 2D Numpy array (NUM_TARGETS * 2)
-        target_positions = np.random.randint(0, [VIDEO_X - TARGET_SIZE, VIDEO_Y - TARGET_SIZE], size=(NUM_TARGETS, 2))
+        # Targets are stored as arrays: (num_targets * 2) top-left corners, sizes and a hit mask
+        self.positions = self.rng.randint(0, [VIDEO_X - self.target_size, VIDEO_Y - self.target_size], size=(self.num_targets, 2))
+        self.sizes = np.full(self.num_targets, self.target_size)
+        self.hit = np.zeros(self.num_targets, dtype=bool)
+        # Kept up to date on every hit, so all_targets_hit does not need to scan
+        self.remaining = self.num_targets
+        
+        self.targets = [Target(self, index) for index in range(self.num_targets)]
+        self._active_targets = None
+        for index, ((x, y), size) in enumerate(zip(self.positions, self.sizes)):
+            self.grid.insert(index, x, y, x + size, y + size)
+    
+    def hit_test(self, indices, positions, radius):
+        """Test the targets at `indices` against pucks at (num_pucks * 2) `positions` in one vectorized pass
+
+        Returns a (num_pucks * num_indices) boolean array
+        """
+        half_sizes = self.sizes[indices] // 2
+        centers = self.positions[indices] + half_sizes[:, None]
+        # (num_pucks, num_indices, 2) offsets from every target center to every puck
+        offsets = positions[:, None, :] - centers[None, :, :]
+        
+        # [dx - side / 2, dy - side / 2] for every pair
+        edge_distances = np.abs(offsets) - half_sizes[:, None]
+        # Calculate the puck's nearest distance from each target's boundary
+        boundary_distances = np.sqrt(np.sum(np.maximum(edge_distances, 0) ** 2, axis=2))
+        # Calculate the distance between the centers
+        center_distances = np.sqrt(np.sum(offsets ** 2, axis=2))
+        
+        return (boundary_distances <= radius) | (center_distances < half_sizes)
+    
+    def check_collisions(self, pucks):
+        """Check for collisions between the pucks of a PuckSet and targets"""
+        # Only targets in the cells touched by the pucks' paths during the last step can be hit
+        lower = np.minimum(pucks.previous_positions, pucks.positions) - pucks.radius
+        upper = np.maximum(pucks.previous_positions, pucks.positions) + pucks.radius
+        candidates = self.grid.query_many(np.hstack([lower, upper]))
+        if not candidates:
+            return []
+        
+        indices = np.fromiter(candidates, dtype=np.intp, count=len(candidates))
+        indices.sort()
+        # A target is hit if any puck hits it
+        hit_indices = indices[self.hit_test(indices, pucks.positions, pucks.radius).any(axis=0)]
+        if len(hit_indices) == 0:
+            return []
         
-        for position in target_positions:
-            self.targets.append(Target(position))
-    
-    def check_collisions(self, puck):
-        """Check for collisions between puck and targets"""
-        newly_hit_targets = []
-        for target in self.targets:
-            if not target.hit and target.is_hit(puck):
-                target.hit = True
-                newly_hit_targets.append(target)
-        return newly_hit_targets
+        self.hit[hit_indices] = True
+        self.remaining -= len(hit_indices)
+        self._active_targets = None
+        for index in hit_indices.tolist():
+            self.grid.remove(index)
+        return [self.targets[index] for index in hit_indices]
     
     def all_targets_hit(self):
         """Check if all targets have been hit"""
-        return all(target.hit for target in self.targets)
+        return self.remaining == 0
     
     def get_active_targets(self):
         """Get list of targets that haven't been hit"""
-        return [target for target in self.targets if not target.hit] 
\ No newline at end of file
+        # Rebuilt only after a hit, not on every call
+        if self._active_targets is None:
+            self._active_targets = [self.targets[index] for index in np.flatnonzero(~self.hit)]
+        return self._active_targets
@@ -2,18 +2,26 @@ import time
 from config import *
 
 class GameState:
-    def __init__(self):
-        """Initialize game state"""
+    def __init__(self, clock=time.time, game_duration=GAME_DURATION):
+        """Initialize game state
+
+        `clock` returns the current time in seconds; headless runs pass a simulated clock
+        """
+        self.clock = clock
+        self.game_duration = game_duration
+        self.reset()
+    
+    def reset(self):
+        """Start a new game: no score, and the timer restarts now"""
         self.score = 0
-        self.start_time = time.time()
-        self.game_duration = GAME_DURATION
+        self.start_time = self.clock()
         self.game_won_time = -1
         self.game_over = False
         self.victory = False
         
     def get_elapsed_time(self):
         """Get elapsed time since game start"""
-        return round(time.time() - self.start_time, 2)
+        return round(self.clock() - self.start_time, 2)
     
     def get_remaining_time(self):
         """Get remaining time in the game"""
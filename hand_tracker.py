@@ -1,38 +1,411 @@
 import cv2
-import mediapipe as mp
+import threading
+import time
+from collections import namedtuple
 import numpy as np
 from config import *
+from scheduler import InferenceScheduler
+
+# MediaPipe hand landmark index of the index finger tip
+INDEX_FINGER_TIP = 8
+# MediaPipe handedness labels; hands store an index into these, or -1 if unknown
+HANDEDNESS_LABELS = ('Left', 'Right')
+
+# Stand-ins for the MediaPipe result types, with the fields the game reads
+Landmark = namedtuple('Landmark', 'x y z')
+HandLandmarks = namedtuple('HandLandmarks', 'landmark')
+Classification = namedtuple('Classification', 'index score label')
+Handedness = namedtuple('Handedness', 'classification')
+HandResults = namedtuple('HandResults', 'multi_hand_landmarks multi_handedness')
+
+class TrackingResult:
+    def __init__(self, results, timestamp, roi):
+        """Hand landmarks of one frame, tagged with the frame's capture time
+
+        Landmarks are normalized to `roi`, the (x, y, width, height) frame region that was processed
+        """
+        self.multi_hand_landmarks = results.multi_hand_landmarks
+        self.multi_handedness = results.multi_handedness
+        self.timestamp = timestamp
+        self.roi = roi
+
+    def to_frame(self, landmark):
+        """Map a normalized landmark to frame pixel coordinates"""
+        roi_x, roi_y, roi_w, roi_h = self.roi
+        return np.array([roi_x + landmark.x * roi_w, roi_y + landmark.y * roi_h])
+
+    def shifted(self, offsets, timestamp):
+        """Copy with every hand's landmarks moved by its (dx, dy) pixel offset, for a later frame"""
+        roi_x, roi_y, roi_w, roi_h = self.roi
+        hands = [HandLandmarks([Landmark(landmark.x + dx / roi_w, landmark.y + dy / roi_h, landmark.z) for landmark in hand.landmark])
+                 for hand, (dx, dy) in zip(self.multi_hand_landmarks, offsets.tolist())]
+        return TrackingResult(HandResults(hands, self.multi_handedness), timestamp, self.roi)
 
 class HandTracker:
-    def __init__(self):
-        """Initialize MediaPipe hand tracking"""
-        # solutions.hands is a template that contains the class Hands and HandLandmark
-        self.mp_hands = mp.solutions.hands
-        # Hands is a class that defines functions to process the result
-        self.hands = self.mp_hands.Hands(
-            static_image_mode=False,
-            max_num_hands=MAX_NUM_HANDS,
-            model_complexity=MODEL_COMPLEXITY,
-            min_detection_confidence=MIN_DETECTION_CONFIDENCE,
-            min_tracking_confidence=MIN_TRACKING_CONFIDENCE
-        )
-        self.mp_draw = mp.solutions.drawing_utils
-        
-    def process_frame(self, image):
-        """Process frame with Mediapipe Solutions task hands"""
-        return self.hands.process(image)
-    
-    def get_paddle_position(self, results):
-        """Extract paddle position from hand landmarks"""
-        index_finger = self.mp_hands.HandLandmark.INDEX_FINGER_TIP
-        
-        if results.multi_hand_landmarks:
-            hand = results.multi_hand_landmarks[0]  # Get the first hand detected
-            
-            # Fetch the coordinates from the Hand Landmark results
-            paddle_x = int(hand.landmark[index_finger].x * VIDEO_X)
-            paddle_y = int(hand.landmark[index_finger].y * VIDEO_Y)
-            # Return as a tuple
-            return (paddle_x, paddle_y)
-        
-        return None 
\ No newline at end of file
+    def __init__(self, mode=HAND_TRACKING_MODE, load_model=True):
+        """Initialize MediaPipe hand tracking
+
+        MediaPipe is imported and its hand model built on a background thread, so the camera and
+        the rest of the game start meanwhile; frames processed before it is ready are not tracked.
+        Subclasses that produce results without a model (replays) pass `load_model=False`.
+        """
+        self.hands = None
+        self._load_error = None
+        self._model_ready = threading.Event()
+        self._loader = None
+        if load_model:
+            self._loader = threading.Thread(target=self._load_model, name='hand-model-loader', daemon=True)
+            self._loader.start()
+        else:
+            self._model_ready.set()
+        self._init_tracking_state()
+
+        # In async mode inference runs on a worker thread, one frame behind the game loop
+        self.pipelined = mode == 'async'
+        self._pending = None
+        self._latest_result = None
+        # RGB copies of submitted frames are converted into reused buffers: in async mode one
+        # can be pending, one in use by the worker and one being filled by the game loop.
+        self._free_buffers = []
+
+        # Inference can be skipped on some frames; the hands are then followed with optical flow
+        # from the last tracked frame, or their last result is reused and extrapolated
+        # In async mode inference runs off the game loop, so it may take up the whole frame time
+        if ADAPTIVE_INFERENCE:
+            self.scheduler = InferenceScheduler(budget=1.0 if mode == 'async' else INFERENCE_BUDGET)
+        else:
+            self.scheduler = None
+        self.flow_tracking = INFERENCE_SKIP_MODE == 'flow'
+        self.inferred_frames = 0
+        self.skipped_frames = 0
+        # While idle (nobody playing) inference runs at most every IDLE_INFERENCE_INTERVAL seconds
+        self.idle = False
+        self._last_inference_time = -np.inf
+        # Grayscale copies of recently submitted frames, by timestamp, to start the flow from
+        self._submitted_grays = {}
+        # Last result produced by optical flow, and the grayscale frame it belongs to
+        self._flow_result = None
+        self._flow_gray = None
+
+        self._running = False
+        self._frame_ready = threading.Condition()
+        self._worker = None
+        if self.pipelined:
+            self._running = True
+            self._worker = threading.Thread(target=self._inference_loop, name='hand-tracker', daemon=True)
+            self._worker.start()
+
+    def _load_model(self):
+        """Import MediaPipe and build the hand model (runs on the loader thread)"""
+        try:
+            # Imported here so replays and headless runs work without MediaPipe installed
+            import mediapipe as mp
+            # Hands is a class that defines functions to process the result. Between frames it
+            # tracks the hand in the coordinates of the last image, which do not carry over from
+            # one ROI crop to the next, so with ROIs every crop is searched on its own.
+            self.hands = mp.solutions.hands.Hands(
+                static_image_mode=HAND_ROI_ENABLED,
+                max_num_hands=MAX_NUM_HANDS,
+                model_complexity=MODEL_COMPLEXITY,
+                min_detection_confidence=MIN_DETECTION_CONFIDENCE,
+                min_tracking_confidence=MIN_TRACKING_CONFIDENCE
+            )
+        except Exception as error:
+            print(f"Error loading the hand tracking model: {error}")
+            self._load_error = error
+        finally:
+            self._model_ready.set()
+
+    def wait_until_ready(self, timeout=None):
+        """Block until the hand model is loaded, raising the error if loading failed
+
+        Returns False if it is still loading after `timeout` seconds
+        """
+        if not self._model_ready.wait(timeout):
+            return False
+        if self._load_error is not None:
+            raise self._load_error
+        return True
+
+    def _init_tracking_state(self, num_hands=MAX_NUM_HANDS):
+        """Reset the per-hand fingertip estimates and the hand box"""
+        # Hand slot i drives paddle i. Per slot: last measured fingertip position, its capture
+        # time, its velocity (pixels/sec) and the hand's handedness
+        self.fingertips = np.zeros((num_hands, 2))
+        self.fingertip_times = np.full(num_hands, -np.inf)
+        self.fingertip_velocities = np.zeros((num_hands, 2))
+        self.handedness = np.full(num_hands, -1)
+        # Slots whose hand was found in the latest result
+        self.tracked = np.zeros(num_hands, dtype=bool)
+        # Capture time of the last result the slots were updated from
+        self.result_time = None
+
+        # Landmark bounding box (x0, y0, x1, y1) of the detected hands, used to place the ROI
+        self.hand_box = None
+
+    def process_frame(self, frame, timestamp=None):
+        """Process a BGR camera frame with Mediapipe Solutions task hands
+
+        In async mode the frame is queued for the worker and the newest finished result is
+        returned instead (None until the first frame has been processed). Returns None while
+        the model is loading.
+        """
+        if timestamp is None:
+            timestamp = time.time()
+        if self.hands is None:
+            # The model is still loading (or failed to)
+            return None
+
+        if self.idle and timestamp - self._last_inference_time < IDLE_INFERENCE_INTERVAL:
+            self.skipped_frames += 1
+            with self._frame_ready:
+                return self._newest(self._latest_result)
+        if self.scheduler is not None:
+            speeds = np.linalg.norm(self.fingertip_velocities[self.tracked], axis=1)
+            self.scheduler.record_motion(speeds.max() if len(speeds) else None)
+            if not self.scheduler.should_run():
+                return self._track_skipped_frame(frame, timestamp)
+        return self._infer(frame, timestamp)
+
+    def _infer(self, frame, timestamp):
+        """Run inference on a frame, or queue it for the worker in async mode"""
+        self.inferred_frames += 1
+        self._last_inference_time = timestamp
+        if self.scheduler is not None and self.flow_tracking:
+            self._remember_frame(frame, timestamp)
+
+        # MediaPipe wants RGB; converting into our own buffer also means the game can keep
+        # drawing on `frame` while the worker reads its copy
+        with self._frame_ready:
+            buffer = self._free_buffers.pop() if self._free_buffers else None
+        if buffer is None or buffer.shape != frame.shape:
+            buffer = np.empty_like(frame)
+            if self.inferred_frames == 1 and self.pipelined:
+                # Whether the worker ever holds all three at once depends on timing, so the spares
+                # are made now rather than at some unpredictable later frame
+                with self._frame_ready:
+                    self._free_buffers.extend(np.empty_like(frame) for _ in range(2))
+        image = cv2.cvtColor(frame, cv2.COLOR_BGR2RGB, dst=buffer)
+
+        if not self.pipelined:
+            self._latest_result = self._run_inference(image, timestamp)
+            self._free_buffers.append(image)
+            return self._latest_result
+
+        with self._frame_ready:
+            # A frame the worker has not picked up yet is replaced by the newer one
+            if self._pending is not None:
+                self._free_buffers.append(self._pending[0])
+            self._pending = (image, timestamp)
+            self._frame_ready.notify()
+            latest = self._latest_result
+        # Results tracked with optical flow on skipped frames may be newer than the worker's
+        return self._newest(latest)
+
+    def _newest(self, latest):
+        """The more recent of `latest` and the last optical flow result"""
+        if self._flow_result is not None and (latest is None or self._flow_result.timestamp > latest.timestamp):
+            return self._flow_result
+        return latest
+
+    def _remember_frame(self, frame, timestamp):
+        """Keep a grayscale copy of a frame inference runs on, as a starting point for optical flow"""
+        self._submitted_grays[timestamp] = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        # Frames whose result is long superseded are not needed any more
+        while len(self._submitted_grays) > 4:
+            del self._submitted_grays[next(iter(self._submitted_grays))]
+
+    def _track_skipped_frame(self, frame, timestamp):
+        """Result for a frame the scheduler skips inference on
+
+        With flow tracking each fingertip is followed with pyramidal Lucas-Kanade optical flow
+        from the frame of the newest result; if the flow loses a fingertip, inference runs on
+        the frame after all. Otherwise the newest result is returned as is and
+        get_paddle_positions extrapolates it.
+        """
+        with self._frame_ready:
+            base = self._newest(self._latest_result)
+        base_gray = None
+        if self.flow_tracking and base is not None and base.multi_hand_landmarks:
+            base_gray = self._flow_gray if base is self._flow_result else self._submitted_grays.get(base.timestamp)
+        if base_gray is None:
+            self.skipped_frames += 1
+            return base
+
+        gray = cv2.cvtColor(frame, cv2.COLOR_BGR2GRAY)
+        points = np.array([base.to_frame(hand.landmark[INDEX_FINGER_TIP]) for hand in base.multi_hand_landmarks], dtype=np.float32)
+        moved = self._follow_points(base_gray, gray, points)
+        if moved is None:
+            # Most likely the hand left the frame or was covered: look for it again
+            self.scheduler.frames_since_inference = 0
+            return self._infer(frame, timestamp)
+
+        self.skipped_frames += 1
+        self._flow_result = base.shifted(moved - points, timestamp)
+        self._flow_gray = gray
+        return self._flow_result
+
+    def _follow_points(self, previous_gray, gray, points):
+        """Where the (n * 2) `points` of `previous_gray` moved to in `gray`, or None if any is lost
+
+        A point is lost if Lucas-Kanade does not find it, if its patch changed by more than
+        FLOW_MAX_ERROR on average, or if flowing back from where it was found misses its start
+        by more than FLOW_MAX_BACKTRACK_ERROR pixels
+        """
+        flow_params = dict(winSize=(FLOW_WINDOW_SIZE, FLOW_WINDOW_SIZE), maxLevel=FLOW_PYRAMID_LEVELS)
+        moved, status, error = cv2.calcOpticalFlowPyrLK(previous_gray, gray, points.reshape(-1, 1, 2), None, **flow_params)
+        if moved is None or not status.all() or (error > FLOW_MAX_ERROR).any():
+            return None
+        back, status, _ = cv2.calcOpticalFlowPyrLK(gray, previous_gray, moved, None, **flow_params)
+        if back is None or not status.all():
+            return None
+        if (np.linalg.norm(back.reshape(-1, 2) - points, axis=1) > FLOW_MAX_BACKTRACK_ERROR).any():
+            return None
+        return moved.reshape(-1, 2)
+
+    def _inference_loop(self):
+        """Run inference on the newest submitted frame until closed"""
+        while True:
+            with self._frame_ready:
+                self._frame_ready.wait_for(lambda: self._pending is not None or not self._running)
+                if not self._running:
+                    return
+                image, timestamp = self._pending
+                self._pending = None
+
+            result = self._run_inference(image, timestamp)
+            with self._frame_ready:
+                self._latest_result = result
+                self._free_buffers.append(image)
+
+    def _get_roi(self, frame_w, frame_h):
+        """Region to search for the hand: around the last landmark box, or the full frame"""
+        if not HAND_ROI_ENABLED or self.hand_box is None:
+            return (0, 0, frame_w, frame_h)
+
+        x0, y0, x1, y1 = self.hand_box
+        # Grow the box on every side so the hand stays inside while it moves
+        margin = HAND_ROI_MARGIN * max(x1 - x0, y1 - y0)
+        half_side = max((max(x1 - x0, y1 - y0) + 2 * margin) / 2, HAND_ROI_MIN_SIZE / 2)
+        center_x, center_y = (x0 + x1) / 2, (y0 + y1) / 2
+
+        roi_x0 = int(max(center_x - half_side, 0))
+        roi_y0 = int(max(center_y - half_side, 0))
+        roi_x1 = int(min(center_x + half_side, frame_w))
+        roi_y1 = int(min(center_y + half_side, frame_h))
+        return (roi_x0, roi_y0, roi_x1 - roi_x0, roi_y1 - roi_y0)
+
+    def _run_inference(self, image, timestamp):
+        """Run MediaPipe on the hand's region of the frame, downscaled if configured"""
+        frame_h, frame_w = image.shape[:2]
+        roi = self._get_roi(frame_w, frame_h)
+        roi_x, roi_y, roi_w, roi_h = roi
+        crop = image[roi_y:roi_y + roi_h, roi_x:roi_x + roi_w]
+
+        if HAND_ROI_DOWNSCALE < 1:
+            crop = cv2.resize(crop, None, fx=HAND_ROI_DOWNSCALE, fy=HAND_ROI_DOWNSCALE, interpolation=cv2.INTER_AREA)
+        else:
+            # MediaPipe needs a contiguous buffer; this is a no-op for the full frame
+            crop = np.ascontiguousarray(crop)
+
+        start = time.perf_counter()
+        result = TrackingResult(self.hands.process(crop), timestamp, roi)
+        if self.scheduler is not None:
+            self.scheduler.record_latency(time.perf_counter() - start)
+
+        # Normalized landmarks do not depend on the downscale, only on the ROI
+        hands = result.multi_hand_landmarks or []
+        if len(hands) == MAX_NUM_HANDS:
+            points = np.array([result.to_frame(landmark) for hand in hands for landmark in hand.landmark])
+            self.hand_box = (*points.min(axis=0), *points.max(axis=0))
+        else:
+            # Tracking lost, or players missing: search the full frame next time
+            self.hand_box = None
+        return result
+
+    def _associate(self, positions, labels, timestamp):
+        """Assign each detected fingertip to a hand slot, so every player keeps their paddle
+
+        Pairs are matched greedily by distance to the slot's last fingertip, plus a penalty when
+        the handedness differs. Slots not seen for HAND_ID_TIMEOUT seconds are free; a fingertip
+        farther than HAND_MATCH_DISTANCE from every recent slot takes a free slot instead.
+        Returns the slot of each detection.
+        """
+        cost = np.linalg.norm(positions[:, None] - self.fingertips[None], axis=2)
+        mismatch = (labels[:, None] >= 0) & (self.handedness[None] >= 0) & (labels[:, None] != self.handedness[None])
+        cost += mismatch * HAND_MATCH_DISTANCE
+        cost[:, timestamp - self.fingertip_times > HAND_ID_TIMEOUT] = HAND_MATCH_DISTANCE
+
+        slots = np.full(len(positions), -1)
+        taken = np.zeros(len(self.fingertips), dtype=bool)
+        for pair in np.argsort(cost, axis=None, kind='stable'):
+            detection, slot = divmod(int(pair), cost.shape[1])
+            if slots[detection] < 0 and not taken[slot]:
+                slots[detection] = slot
+                taken[slot] = True
+        return slots
+
+    def _update_fingertips(self, results):
+        """Update the hand slots from a new result"""
+        hands = results.multi_hand_landmarks or []
+        # Fetch the fingertip coordinates, mapped back from the ROI to the frame
+        positions = np.array([results.to_frame(hand.landmark[INDEX_FINGER_TIP]) for hand in hands]).reshape(-1, 2)
+        if results.multi_handedness:
+            labels = np.array([HANDEDNESS_LABELS.index(handedness.classification[0].label)
+                               for handedness in results.multi_handedness])
+        else:
+            labels = np.full(len(hands), -1)
+
+        slots = self._associate(positions, labels, results.timestamp)
+        found = slots >= 0
+        slots, positions, labels = slots[found], positions[found], labels[found]
+
+        # Velocity from consecutive measurements; a hand that was lost starts afresh
+        elapsed = results.timestamp - self.fingertip_times[slots]
+        continuing = self.tracked[slots] & (elapsed > 0)
+        velocity = (positions - self.fingertips[slots]) / np.where(continuing, elapsed, 1)[:, None]
+        smoothed = (FINGERTIP_VELOCITY_SMOOTHING * velocity +
+                    (1 - FINGERTIP_VELOCITY_SMOOTHING) * self.fingertip_velocities[slots])
+        self.fingertip_velocities[slots] = np.where(continuing[:, None], smoothed, 0)
+
+        self.fingertips[slots] = positions
+        self.fingertip_times[slots] = results.timestamp
+        self.handedness[slots] = np.where(labels >= 0, labels, self.handedness[slots])
+        self.tracked[:] = False
+        self.tracked[slots] = True
+
+    def get_paddle_positions(self, results, at_time=None):
+        """Extract one paddle position per hand slot from hand landmarks (None for hands not tracked)
+
+        With LATENCY_COMPENSATION each fingertip is extrapolated from its capture time to `at_time`
+        """
+        if results is None:
+            self.tracked[:] = False
+        # Async mode returns the same result for several frames; only new ones update the slots
+        elif results.timestamp != self.result_time:
+            self.result_time = results.timestamp
+            self._update_fingertips(results)
+
+        positions = self.fingertips
+        if LATENCY_COMPENSATION and at_time is not None:
+            lead_time = np.clip(at_time - self.fingertip_times, 0, MAX_PREDICTION_TIME)
+            positions = positions + self.fingertip_velocities * lead_time[:, None]
+
+        # Return as (float) tuples; the paddle estimator smooths them further
+        return [(x, y) if tracked else None for (x, y), tracked in zip(positions.tolist(), self.tracked)]
+
+    def get_paddle_position(self, results, at_time=None):
+        """Paddle position of the first hand slot, for single-player callers"""
+        return self.get_paddle_positions(results, at_time)[0]
+
+    def close(self):
+        """Stop the inference worker and release the MediaPipe graph"""
+        with self._frame_ready:
+            self._running = False
+            self._frame_ready.notify_all()
+        if self._worker is not None:
+            self._worker.join()
+        if self._loader is not None:
+            self._loader.join()
+        if self.hands is not None:
+            self.hands.close()
@@ -0,0 +1,115 @@
+"""
+Headless game runner
+
+Plays the game from a scripted or recorded paddle trajectory on a simulated
+clock, with no camera, MediaPipe or window. Runs are deterministic for a
+given seed and trajectory, so they can be used for regression checks and
+benchmarks in CI.
+"""
+
+import sys
+import numpy as np
+from config import *
+from simulation import GameSimulation
+
+class SimulatedClock:
+    def __init__(self, start=0.0):
+        """Clock that only moves when advanced, standing in for time.time"""
+        self.now = start
+
+    def __call__(self):
+        return self.now
+
+    def advance(self, seconds):
+        """Move the clock forward"""
+        self.now += seconds
+
+def sweep_trajectory(t):
+    """Scripted paddle input: a Lissajous sweep over most of the field"""
+    x = VIDEO_X / 2 + 0.4 * VIDEO_X * np.sin(2.1 * t)
+    y = VIDEO_Y / 2 + 0.4 * VIDEO_Y * np.sin(1.3 * t + 0.5)
+    return (x, y)
+
+class RecordedTrajectory:
+    def __init__(self, timestamps, positions):
+        """Paddle input replayed from recorded (timestamp, position) samples
+
+        Rows of `positions` that are NaN mean the hand was not tracked at that time
+        """
+        self.timestamps = np.asarray(timestamps, dtype=float)
+        self.positions = np.asarray(positions, dtype=float)
+
+    def __call__(self, t):
+        # Use the latest sample at or before t
+        index = np.searchsorted(self.timestamps, t, side='right') - 1
+        if index < 0 or np.isnan(self.positions[index]).any():
+            return None
+        return tuple(self.positions[index])
+
+class HeadlessGame:
+    def __init__(self, paddle_trajectory=sweep_trajectory, seed=0, frame_rate=30, renderer=None,
+                 num_pucks=NUM_PUCKS, num_targets=NUM_TARGETS, profiler=None, **settings):
+        """Set up a game driven by `paddle_trajectory(t)`, which returns a position or None
+
+        Pass a list of trajectories for one paddle each, and a Renderer to also draw every
+        frame into an offscreen image. Other keywords are game settings for GameSimulation,
+        e.g. target_size=20; the renderer must be built for the same target size.
+        """
+        self.paddle_trajectories = paddle_trajectory if isinstance(paddle_trajectory, (list, tuple)) else [paddle_trajectory]
+        self.frame_time = 1.0 / frame_rate
+        self.clock = SimulatedClock()
+        self.rng = np.random.RandomState(seed)
+        self.simulation = GameSimulation(self.clock, self.rng, num_pucks, num_targets, profiler, len(self.paddle_trajectories),
+                                         **settings)
+        self.game_state = self.simulation.game_state
+        target_size = self.simulation.target_manager.target_size
+        if renderer is not None and renderer.target_size != target_size:
+            raise ValueError(f"Renderer draws {renderer.target_size} px targets, the game has {target_size} px targets")
+        self.renderer = renderer
+        self.image = np.zeros((VIDEO_Y, VIDEO_X, 3), dtype=np.uint8) if renderer is not None else None
+        self.frames = 0
+
+    def step(self):
+        """Simulate one rendered frame"""
+        self.clock.advance(self.frame_time)
+        paddle_positions = [trajectory(self.clock.now) for trajectory in self.paddle_trajectories]
+        self.simulation.update(self.frame_time, paddle_positions)
+
+        if self.renderer is not None:
+            self.image[:] = 0
+            self.simulation.render(self.image, self.renderer)
+            with self.simulation.profiler.span('render'):
+                self.renderer.draw_ui(self.image, self.game_state.score, self.game_state.get_remaining_time(), self.game_state.game_over)
+        self.simulation.profiler.end_frame()
+        self.frames += 1
+
+    def reset(self):
+        """Start a new game on the same simulation and renderer; the clock keeps running"""
+        self.simulation.reset()
+        self.frames = 0
+
+    def run(self, max_frames=None):
+        """Play until the game is over (or `max_frames` frames) and return the results"""
+        while not self.game_state.game_over and (max_frames is None or self.frames < max_frames):
+            self.step()
+        return self.get_results()
+
+    def get_results(self):
+        """Summary of the game so far"""
+        return {
+            'score': self.game_state.score,
+            'victory': self.game_state.victory,
+            'game_over': self.game_state.game_over,
+            'time_to_win': self.game_state.game_won_time if self.game_state.victory else None,
+            'frames': self.frames,
+            'physics_steps': self.simulation.steps,
+            'paddle_hits': self.simulation.paddle_hits,
+        }
+
+if __name__ == "__main__":
+    # Optionally replay the fingertip from a hand tracking recording: python headless.py session.trk
+    if len(sys.argv) > 1:
+        from recording import ReplayTrajectory, TrackingRecording
+        print(HeadlessGame(ReplayTrajectory(TrackingRecording(sys.argv[1]))).run())
+    else:
+        print(HeadlessGame().run())
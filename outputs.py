@@ -0,0 +1,216 @@
+"""
+Frame outputs besides the local window
+
+Each output copies the frames it wants into a small pool of reused buffers,
+scaled to its own resolution and decimated to its own frame rate, and hands
+them to a background encoder thread through a bounded queue. When the
+encoder falls behind, the oldest queued frame is dropped, so writing never
+blocks the game loop.
+"""
+
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import cv2
+import numpy as np
+from config import *
+
+class EncodedOutput:
+    def __init__(self, size=OUTPUT_SIZE, fps=OUTPUT_FPS, queue_size=OUTPUT_QUEUE_SIZE, name='output'):
+        """Base of the threaded outputs: subclasses implement encode(frame, timestamp) and finish()
+
+        `size` is the (width, height) frames are scaled to, None for the game's resolution,
+        and `fps` the highest rate frames are taken at (0 for every frame)
+        """
+        self.size = tuple(size) if size else None
+        self.frame_interval = 1.0 / fps if fps else 0
+        self.queue_size = queue_size
+        self.next_frame_time = None
+
+        # Frames encoded, and frames dropped because the encoder fell behind
+        self.written_frames = 0
+        self.dropped_frames = 0
+
+        self._queue = []
+        self._free_buffers = []
+        self._running = True
+        self._frames_ready = threading.Condition()
+        self._thread = threading.Thread(target=self._encode_loop, name=name, daemon=True)
+        self._thread.start()
+
+    def write(self, image, timestamp=None):
+        """Queue a BGR frame for encoding, unless it comes sooner than the output's frame rate allows"""
+        if timestamp is None:
+            timestamp = time.time()
+        if self.frame_interval:
+            if self.next_frame_time is not None and timestamp < self.next_frame_time:
+                return
+            # Due times stay on the output's schedule, unless the game fell far behind it
+            if self.next_frame_time is None or timestamp >= self.next_frame_time + self.frame_interval:
+                self.next_frame_time = timestamp
+            self.next_frame_time += self.frame_interval
+
+        with self._frames_ready:
+            buffer = self._free_buffers.pop() if self._free_buffers else None
+        shape = (self.size[1], self.size[0], 3) if self.size else image.shape
+        if buffer is None or buffer.shape != shape:
+            buffer = np.empty(shape, dtype=np.uint8)
+        # One pass copies the frame out of the game's buffer and scales it
+        if self.size:
+            cv2.resize(image, self.size, dst=buffer, interpolation=cv2.INTER_AREA)
+        else:
+            np.copyto(buffer, image)
+
+        with self._frames_ready:
+            if len(self._queue) >= self.queue_size:
+                # Backpressure: the oldest frame goes, the newest is always kept
+                self._free_buffers.append(self._queue.pop(0)[0])
+                self.dropped_frames += 1
+            self._queue.append((buffer, timestamp))
+            self._frames_ready.notify()
+
+    def _encode_loop(self):
+        """Encode queued frames until closed, then the ones still queued"""
+        while True:
+            with self._frames_ready:
+                self._frames_ready.wait_for(lambda: self._queue or not self._running)
+                if not self._queue:
+                    break
+                frame, timestamp = self._queue.pop(0)
+            self.encode(frame, timestamp)
+            self.written_frames += 1
+            with self._frames_ready:
+                self._free_buffers.append(frame)
+        self.finish()
+
+    def encode(self, frame, timestamp):
+        """Encode one frame (runs on the encoder thread)"""
+        raise NotImplementedError
+
+    def finish(self):
+        """Release the encoder (runs on the encoder thread once closed)"""
+        pass
+
+    def close(self):
+        """Encode the frames still queued and stop the encoder"""
+        with self._frames_ready:
+            self._running = False
+            self._frames_ready.notify_all()
+        self._thread.join()
+
+class MJPEGServer(EncodedOutput):
+    def __init__(self, host=MJPEG_HOST, port=MJPEG_PORT, quality=MJPEG_QUALITY, **options):
+        """Serve the game as an MJPEG stream at http://host:port/, viewable in any browser
+
+        Every client gets the newest JPEG, so a slow client skips frames instead of holding up others
+        """
+        self.quality = quality
+        self.jpeg = None
+        self.jpeg_index = 0
+        self._jpeg_ready = threading.Condition()
+
+        output = self
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                output._stream(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        # Bound before the encoder starts, so a port in use fails without leaving a thread behind
+        self.server = ThreadingHTTPServer((host, port), Handler)
+        self.server.daemon_threads = True
+        super().__init__(name='mjpeg-encoder', **options)
+        self._server_thread = threading.Thread(target=self.server.serve_forever, name='mjpeg-server', daemon=True)
+        self._server_thread.start()
+        print(f"Streaming the game at http://{host}:{self.server.server_port}/")
+
+    def encode(self, frame, timestamp):
+        success, jpeg = cv2.imencode('.jpg', frame, [cv2.IMWRITE_JPEG_QUALITY, self.quality])
+        if success:
+            with self._jpeg_ready:
+                self.jpeg = jpeg.tobytes()
+                self.jpeg_index += 1
+                self._jpeg_ready.notify_all()
+
+    def _stream(self, handler):
+        """Send JPEGs to one client as they are encoded, until it disconnects or the server stops"""
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'multipart/x-mixed-replace; boundary=frame')
+        handler.send_header('Cache-Control', 'no-cache')
+        handler.end_headers()
+        sent_index = 0
+        while True:
+            with self._jpeg_ready:
+                self._jpeg_ready.wait_for(lambda: self.jpeg_index != sent_index or not self._running, timeout=1.0)
+                if not self._running:
+                    return
+                if self.jpeg_index == sent_index:
+                    continue
+                jpeg, sent_index = self.jpeg, self.jpeg_index
+            try:
+                handler.wfile.write(b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: %d\r\n\r\n' % len(jpeg))
+                handler.wfile.write(jpeg)
+                handler.wfile.write(b'\r\n')
+            except OSError:
+                # The client went away
+                return
+
+    def close(self):
+        super().close()
+        with self._jpeg_ready:
+            self._jpeg_ready.notify_all()
+        self.server.shutdown()
+        self.server.server_close()
+
+class SegmentedVideoWriter(EncodedOutput):
+    def __init__(self, directory=VIDEO_OUTPUT_DIR, segment_seconds=VIDEO_SEGMENT_SECONDS, fourcc=VIDEO_FOURCC, **options):
+        """Write the game to video files in `directory`, starting a new file every `segment_seconds`"""
+        self.directory = directory
+        self.segment_seconds = segment_seconds
+        self.fourcc = cv2.VideoWriter_fourcc(*fourcc)
+        self.extension = '.avi' if fourcc == 'MJPG' else '.mp4'
+        self.writer = None
+        self.segment_start = None
+        self.segments = []
+        os.makedirs(directory, exist_ok=True)
+        super().__init__(name='video-encoder', **options)
+
+    def encode(self, frame, timestamp):
+        if self.writer is None or timestamp - self.segment_start >= self.segment_seconds:
+            self._start_segment(frame, timestamp)
+        self.writer.write(frame)
+
+    def _start_segment(self, frame, timestamp):
+        """Close the current file and open the next one, named after its first frame's time"""
+        self.finish()
+        name = time.strftime('game_%Y%m%d_%H%M%S', time.localtime(timestamp)) + self.extension
+        path = os.path.join(self.directory, name)
+        # Files play back at the output's frame rate; the game's rate if frames are not decimated
+        fps = 1.0 / self.frame_interval if self.frame_interval else 1.0 / TARGET_FRAME_TIME
+        self.writer = cv2.VideoWriter(path, self.fourcc, fps, (frame.shape[1], frame.shape[0]))
+        if not self.writer.isOpened():
+            print(f"Error: Could not open video file {path}")
+        self.segment_start = timestamp
+        self.segments.append(path)
+
+    def finish(self):
+        if self.writer is not None:
+            self.writer.release()
+            self.writer = None
+
+OUTPUTS = {
+    'mjpeg': MJPEGServer,
+    'video': SegmentedVideoWriter,
+}
+
+def make_outputs(names=OUTPUT_SINKS):
+    """Outputs named in OUTPUT_SINKS"""
+    outputs = []
+    for name in names:
+        if name not in OUTPUTS:
+            print(f"Unknown output '{name}', choose from: {', '.join(OUTPUTS)}")
+            continue
+        outputs.append(OUTPUTS[name]())
+    return outputs
@@ -1,70 +1,191 @@
 import numpy as np
-import time
 from config import *
 
-class PhysicsEngine:
-    def __init__(self):
-        """Initialize physics engine"""
-        self.previous_collision_time = -1
+class FixedTimestep:
+    def __init__(self, dt=PHYSICS_DT, max_steps=MAX_PHYSICS_STEPS):
+        """Accumulate real frame time and hand it out as fixed physics steps"""
+        self.dt = dt
+        self.max_steps = max_steps
+        self.reset()
     
-    def check_wall_collision(self, puck):
-        """Check for collisions with walls and handle bouncing"""
-        # Check left and right walls
-        if puck.position[0] <= puck.radius + 1:                 # Left wall
-            puck.position[0] = puck.radius + 1                  # +1 just in case
-            puck.velocity[0] = -puck.velocity[0]
-        elif puck.position[0] + puck.radius >= VIDEO_X - 1:     # Right wall
-            puck.position[0] = VIDEO_X - puck.radius - 1        # -1 just in case
-            puck.velocity[0] = -puck.velocity[0]
-        
-        # Check top and bottom walls
-        if puck.position[1] <= puck.radius + 1:                 # Top wall
-            puck.position[1] = puck.radius + 1
-            puck.velocity[1] = -puck.velocity[1]
-        elif puck.position[1] + puck.radius >= VIDEO_Y - 1:     # Bottom wall
-            puck.position[1] = VIDEO_Y - puck.radius - 1
-            puck.velocity[1] = -puck.velocity[1]
+    def reset(self):
+        """Drop any accumulated time"""
+        self.accumulator = 0.0
+        # Fraction of a step left in the accumulator, used to interpolate render positions
+        self.alpha = 0.0
     
-    def check_paddle_collision(self, puck, paddle, current_time):
-        """Check for collision between puck and paddle"""
-        dx = puck.position[0] - paddle.position[0]
-        dy = puck.position[1] - paddle.position[1]
-        distance = np.sqrt(dx ** 2 + dy ** 2)
-        # distance = np.linalg.norm(puck.position - np.array(paddle.position))
-
-        if distance <= (puck.radius + paddle.radius + 1) and self.previous_collision_time + 0.5 < current_time:
-            # Get the angle in cos and sin terms for the collision normal vector
-            collision_normal = np.array([dx / distance, dy / distance])
-        
-            # Get current velocity as numpy array
-            current_velocity = np.array(puck.velocity)
-            
-            # Calculate velocity components
-            # Parallel component (along collision normal) (vel vector . dir vector = parallel vel vector)
-            # This is: vx cos + vy sin
-            parallel_vel = np.dot(current_velocity, collision_normal)
-            
-            # Perpendicular component (tangent to collision surface)
-            # This is actually: vx sin^2 + vy cos^2
-            perpendicular_vel_sq = current_velocity - parallel_vel * collision_normal
-            
-            # Reverse the parallel component (bounce)
-            # This is actually: -vx cos^2 - vy sin^2
-            new_parallel_vel_sq = -parallel_vel * collision_normal
-            
-            # Combine components for new velocity
-            # This becomes: vx (sin^2 - cos^2) + vy (cos^2 - sin^2)
-            new_velocity = perpendicular_vel_sq + new_parallel_vel_sq
-            
-            # Update puck velocity (keep as numpy array)
-            puck.velocity = new_velocity.astype(float)
-            
-            # Move puck outside paddle to prevent sticking
-            overlap = np.ceil((puck.radius + paddle.radius) - distance).astype(int)
-            puck.position += collision_normal.astype(int) * (overlap + 2)
+    def advance(self, frame_time):
+        """Add `frame_time` seconds and return the number of physics steps to run"""
+        self.accumulator += frame_time
+        steps = int(self.accumulator // self.dt)
+        if steps > self.max_steps:
+            # Too far behind (e.g. a stalled frame): drop the backlog instead of catching up
+            steps = self.max_steps
+            self.accumulator = self.dt * steps
+        self.accumulator -= steps * self.dt
+        self.alpha = self.accumulator / self.dt
+        return steps
 
-            self.previous_collision_time = current_time
+class PhysicsEngine:
+    def step(self, pucks, paddles, dt, paddle_start, paddle_end, paddle_velocities=None):
+        """Advance every puck of a PuckSet by one fixed step of `dt` seconds
 
-            return True
+        The paddles (a PaddleSet, or a single Paddle) move from the rows of `paddle_start`
+        to those of `paddle_end` during the step. Their velocities in collisions are
+        `paddle_velocities` if given, otherwise their displacement over the step.
+        Returns a boolean array of the pucks a paddle hit.
+        """
+        puck_start = pucks.positions.copy()
+        pucks.update_positions(dt)
+        hits = self.check_paddle_collision(pucks, paddles, puck_start, paddle_start, paddle_end, dt, paddle_velocities)
+        if pucks.count > 1:
+            self.check_puck_collisions(pucks)
+        self.check_wall_collision(pucks)
+        return hits
+    
+    def check_wall_collision(self, pucks):
+        """Check for collisions with walls and handle bouncing"""
+        # A puck that crossed a wall during the step is mirrored back by the distance it overshot,
+        # so it ends up where it would have been had it bounced at the moment of contact
+        low = pucks.radius + 1                                          # +1 just in case
+        high = np.array([VIDEO_X, VIDEO_Y]) - pucks.radius - 1          # -1 just in case
+        positions, velocities = pucks.positions, pucks.velocities
+        
+        # Left and top walls
+        crossed = positions <= low
+        positions[:] = np.where(crossed, np.minimum(2 * low - positions, high), positions)
+        velocities[:] = np.where(crossed, np.abs(velocities), velocities)
+        # Right and bottom walls
+        crossed = positions >= high
+        positions[:] = np.where(crossed, np.maximum(2 * high - positions, low), positions)
+        velocities[:] = np.where(crossed, -np.abs(velocities), velocities)
+    
+    def check_paddle_collision(self, pucks, paddles, puck_start, paddle_start, paddle_end, dt, paddle_velocities=None):
+        """Check for collisions between all pucks and all paddles over the whole step (swept circles)"""
+        contact_distance = pucks.radius + paddles.radius
+        paddle_start, paddle_end = np.atleast_2d(paddle_start), np.atleast_2d(paddle_end)
+        if len(paddle_start) == 0:
+            return np.zeros(pucks.count, dtype=bool)
+        paddle_motion = paddle_end - paddle_start
+        
+        # Relative position d(t) = d0 + t * dd of each puck seen from each paddle, for t in [0, 1].
+        # Arrays are (pucks * paddles [* 2]), so every pair is tested in one pass.
+        d0 = puck_start[:, None] - paddle_start[None]
+        dd = (pucks.positions - puck_start)[:, None] - paddle_motion[None]
+        
+        # Time of impact: smallest t with |d(t)| = contact distance, i.e. a t^2 + b t + c = 0
+        a = np.sum(dd * dd, axis=2)
+        b = 2 * np.sum(d0 * dd, axis=2)
+        c = np.sum(d0 * d0, axis=2) - contact_distance ** 2
+        discriminant = b ** 2 - 4 * a * c
+        
+        toi = np.full(a.shape, np.inf)
+        # Already touching at the start of the step (e.g. the hand reappeared on the puck)
+        toi[c <= 0] = 0.0
+        approaching = (c > 0) & (a > 0) & (discriminant >= 0)
+        toi[approaching] = (-b[approaching] - np.sqrt(discriminant[approaching])) / (2 * a[approaching])
+        
+        # Each puck bounces off the paddle it reaches first during the step
+        paddle_index = np.argmin(toi, axis=1)
+        toi = toi[np.arange(pucks.count), paddle_index]
+        hits = (toi >= 0) & (toi <= 1)
+        if not hits.any():
+            return hits
+        
+        # Only the pucks that hit a paddle, and the paddle each one hit, are handled from here on
+        paddle_index = paddle_index[hits]
+        toi = toi[hits, None]
+        dd = dd[hits, paddle_index]
+        puck_start = puck_start[hits]
+        paddle_start, paddle_motion, paddle_end = paddle_start[paddle_index], paddle_motion[paddle_index], paddle_end[paddle_index]
+        puck_contact = puck_start + toi * (pucks.positions[hits] - puck_start)
+        paddle_contact = paddle_start + toi * paddle_motion
+        offset = puck_contact - paddle_contact
+        distance = np.linalg.norm(offset, axis=1, keepdims=True)
+        
+        # Collision normal pointing from the paddle to the puck. If the centers coincide,
+        # push the puck back the way it came relative to the paddle (or up if it did not move).
+        dd_norm = np.linalg.norm(dd, axis=1, keepdims=True)
+        fallback = np.where(dd_norm > 0, -dd / np.maximum(dd_norm, 1e-12), [0.0, -1.0])
+        collision_normal = np.where(distance > 0, offset / np.maximum(distance, 1e-12), fallback)
+        
+        # The paddle is treated as infinitely heavy, so only the puck's velocity changes
+        velocities = pucks.velocities[hits]
+        paddle_velocity = paddle_motion / dt if paddle_velocities is None else np.atleast_2d(paddle_velocities)[paddle_index]
+        approach_speed = np.sum((velocities - paddle_velocity) * collision_normal, axis=1, keepdims=True)
+        # Reflect the normal component of the relative velocity; the tangential part is kept
+        velocities -= (1 + PADDLE_RESTITUTION) * np.minimum(approach_speed, 0) * collision_normal
+        speed = np.linalg.norm(velocities, axis=1, keepdims=True)
+        velocities *= np.minimum(1, MAX_PUCK_SPEED / np.maximum(speed, 1e-12))
+        
+        # Spend the rest of the step moving away from the contact point with the new velocity
+        positions = puck_contact + velocities * (1 - toi) * dt
+        
+        # The paddle may still be moving into the puck: keep them separated at the end of the step
+        offset = positions - paddle_end
+        distance = np.linalg.norm(offset, axis=1, keepdims=True)
+        # A paddle faster than the puck would overtake it: keep the puck in front instead
+        overtaken = np.sum(offset * collision_normal, axis=1, keepdims=True) <= 0
+        overlapping = ~overtaken & (distance < contact_distance)
+        positions = np.where(overtaken, paddle_end + collision_normal * (contact_distance + 1), positions)
+        positions = np.where(overlapping, paddle_end + offset / np.maximum(distance, 1e-12) * (contact_distance + 1), positions)
+        # but never through a wall: the wall pass would mirror the puck back into the paddle
+        separated = positions
+        positions = np.clip(positions, pucks.radius + 1, np.array([VIDEO_X, VIDEO_Y]) - pucks.radius - 1)
+        # A puck pinned between the paddle and a wall stops moving into the wall, or every
+        # bounce off the wall would send it back into the paddle faster
+        pinned = np.linalg.norm(positions - paddle_end, axis=1, keepdims=True) < contact_distance
+        velocities[(positions != separated) & pinned] = 0
+        
+        pucks.positions[hits] = positions
+        pucks.velocities[hits] = velocities
+        # Only an approaching puck is hit, and a puck the paddle keeps pressing against a wall is hit once
+        hits[hits] = (approach_speed[:, 0] < 0) & ~((toi[:, 0] == 0) & pinned[:, 0])
+        return hits
+    
+    def check_puck_collisions(self, pucks):
+        """Bounce touching pucks off each other, found with a sort-and-sweep broad phase"""
+        positions, velocities = pucks.positions, pucks.velocities
+        diameter = 2 * pucks.radius
+        
+        # Broad phase: after sorting by x, only pucks within one diameter along x can touch.
+        # Compare every puck with its k-th neighbour in x order until no neighbour is that close.
+        order = np.argsort(positions[:, 0], kind='stable')
+        xs = positions[order, 0]
+        first, second = [], []
+        for k in range(1, pucks.count):
+            close = xs[k:] - xs[:-k] < diameter
+            if not close.any():
+                break
+            first.append(order[:-k][close])
+            second.append(order[k:][close])
+        if not first:
+            return 0
+        first, second = np.concatenate(first), np.concatenate(second)
+        
+        # Narrow phase: keep the pairs that actually overlap
+        offset = positions[second] - positions[first]
+        distance = np.linalg.norm(offset, axis=1)
+        touching = distance < diameter
+        first, second, offset, distance = first[touching], second[touching], offset[touching], distance[touching]
+        if len(first) == 0:
+            return 0
+        
+        # Collision normal from the first puck to the second
+        normal = np.where(distance[:, None] > 0, offset / np.maximum(distance, 1e-12)[:, None], [1.0, 0.0])
+        
+        # Equal masses, elastic: exchange the normal velocity components of approaching pairs.
+        # All pairs are resolved at once, so a puck touching several others gets the average
+        # of its impulses; summing them would add energy in dense clusters.
+        contacts = np.bincount(np.concatenate([first, second]), minlength=pucks.count)
+        share = 1 / np.maximum(contacts[first], contacts[second])
+        approach_speed = np.sum((velocities[first] - velocities[second]) * normal, axis=1)
+        impulse = (np.maximum(approach_speed, 0) * share)[:, None] * normal
+        np.subtract.at(velocities, first, impulse)
+        np.add.at(velocities, second, impulse)
         
-        return False
\ No newline at end of file
+        # Push each pair apart by half the overlap so they do not stick together
+        correction = ((diameter - distance) / 2)[:, None] * normal
+        np.subtract.at(positions, first, correction)
+        np.add.at(positions, second, correction)
+        return len(first)
@@ -0,0 +1,117 @@
+import csv
+import json
+import time
+from contextlib import contextmanager, nullcontext
+import numpy as np
+from config import *
+
+# Percentiles reported for every stage
+PERCENTILES = (50, 95, 99)
+
+class FrameProfiler:
+    def __init__(self, window=PROFILE_WINDOW, export_path=PROFILE_EXPORT_PATH, export_interval=PROFILE_EXPORT_INTERVAL):
+        """Record how long each named stage of a frame takes, over a rolling window of frames
+
+        With `export_path` set, percentiles are appended every `export_interval` seconds
+        as JSON lines, or as CSV rows if the path ends in .csv
+        """
+        self.window = window
+        # Stage name -> ring buffer of per-frame durations in seconds
+        self.history = {}
+        # Number of frames recorded so far
+        self.frames = 0
+        # Durations of the frame in progress; a stage can run several times per frame
+        self.current = {}
+        self.frame_start = time.perf_counter()
+
+        self.export_path = export_path
+        self.export_interval = export_interval
+        self.last_export = time.time()
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as part of stage `name`"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.current[name] = self.current.get(name, 0.0) + time.perf_counter() - start
+
+    def end_frame(self):
+        """Close the current frame and store its per-stage totals"""
+        now = time.perf_counter()
+        self.current['frame'] = now - self.frame_start
+        self.frame_start = now
+
+        slot = self.frames % self.window
+        for name, duration in self.current.items():
+            if name not in self.history:
+                # Stages first seen mid-run are NaN for the frames before, and ignored in the stats
+                self.history[name] = np.full(self.window, np.nan)
+            self.history[name][slot] = duration
+        # Stages that did not run this frame (e.g. no physics step) took no time
+        for name, durations in self.history.items():
+            if name not in self.current:
+                durations[slot] = 0.0
+        self.current = {}
+        self.frames += 1
+
+        if self.export_path and time.time() - self.last_export >= self.export_interval:
+            self.export()
+
+    def get_samples(self, name):
+        """Per-frame durations of a stage in the window, oldest first"""
+        durations = self.history.get(name)
+        if durations is None:
+            return np.empty(0)
+        if self.frames > self.window:
+            durations = np.roll(durations, -(self.frames % self.window))
+        durations = durations[:min(self.frames, self.window)]
+        return durations[~np.isnan(durations)]
+
+    def get_percentiles(self):
+        """Stage name -> (p50, p95, p99) durations in seconds over the window"""
+        stats = {}
+        for name in self.history:
+            samples = self.get_samples(name)
+            if len(samples):
+                stats[name] = tuple(np.percentile(samples, PERCENTILES))
+        return stats
+
+    def export(self):
+        """Append the current percentiles to the export file"""
+        self.last_export = time.time()
+        stats = self.get_percentiles()
+        if self.export_path.endswith('.csv'):
+            with open(self.export_path, 'a', newline='') as export_file:
+                writer = csv.writer(export_file)
+                if export_file.tell() == 0:
+                    writer.writerow(['time', 'frames', 'stage'] + [f'p{p}_ms' for p in PERCENTILES])
+                for name, values in stats.items():
+                    writer.writerow([round(self.last_export, 3), self.frames, name] + [round(v * 1e3, 3) for v in values])
+        else:
+            record = {
+                'time': round(self.last_export, 3),
+                'frames': self.frames,
+                'stages': {name: {f'p{p}_ms': round(v * 1e3, 3) for p, v in zip(PERCENTILES, values)}
+                           for name, values in stats.items()},
+            }
+            with open(self.export_path, 'a') as export_file:
+                export_file.write(json.dumps(record) + '\n')
+
+class NullProfiler:
+    """Profiler that records nothing, used when profiling is off"""
+    _span = nullcontext()
+
+    def span(self, name):
+        return self._span
+
+    def end_frame(self):
+        pass
+
+    def get_percentiles(self):
+        return {}
+
+def make_profiler():
+    """Profiler selected by PROFILING_ENABLED"""
+    return FrameProfiler() if PROFILING_ENABLED else NullProfiler()
@@ -0,0 +1,203 @@
+"""
+Hand tracking recording and replay
+
+A recording is a small header followed by fixed-size binary records, one per
+tracking result: capture timestamp, processed region, and per hand its
+handedness, confidence and landmarks. Records are appended in chunks while
+playing and read back through a memory map, so long sessions are streamed
+from disk instead of loaded into memory.
+"""
+
+import math
+import time
+import numpy as np
+from config import *
+from camera import SyntheticSource
+from hand_tracker import (HandTracker, TrackingResult, HANDEDNESS_LABELS, INDEX_FINGER_TIP,
+                          Landmark, HandLandmarks, Classification, Handedness, HandResults)
+
+RECORDING_MAGIC = b'AIRTRACK'
+RECORDING_VERSION = 1
+NUM_LANDMARKS = 21
+# Records buffered in memory before they are written out
+RECORD_CHUNK_SIZE = 64
+
+_HEADER_DTYPE = np.dtype([
+    ('magic', 'S8'),
+    ('version', '<u2'),
+    ('max_hands', '<u2'),
+    ('num_landmarks', '<u2'),
+    ('reserved', '<u2'),
+])
+
+def record_dtype(max_hands, num_landmarks=NUM_LANDMARKS):
+    """Layout of one record; handedness is an index into HANDEDNESS_LABELS, or -1 if unknown"""
+    return np.dtype([
+        ('timestamp', '<f8'),
+        ('roi', '<i4', (4,)),
+        ('num_hands', 'u1'),
+        ('handedness', 'i1', (max_hands,)),
+        ('scores', '<f4', (max_hands,)),
+        ('landmarks', '<f4', (max_hands, num_landmarks, 3)),
+    ])
+
+class TrackingRecorder:
+    def __init__(self, path, max_hands=MAX_NUM_HANDS):
+        """Append every new tracking result to the recording file at `path`"""
+        self.path = path
+        self.max_hands = max_hands
+        self.dtype = record_dtype(max_hands)
+        self.file = open(path, 'wb')
+
+        header = np.zeros(1, dtype=_HEADER_DTYPE)
+        header['magic'] = RECORDING_MAGIC
+        header['version'] = RECORDING_VERSION
+        header['max_hands'] = max_hands
+        header['num_landmarks'] = NUM_LANDMARKS
+        self.file.write(header.tobytes())
+
+        self.chunk = np.zeros(RECORD_CHUNK_SIZE, dtype=self.dtype)
+        self.chunk_length = 0
+        self.recorded = 0
+        self.last_timestamp = None
+
+    def record(self, result):
+        """Store a TrackingResult; None and results already stored (async mode repeats them) are skipped"""
+        if result is None or result.timestamp == self.last_timestamp:
+            return
+        self.last_timestamp = result.timestamp
+
+        record = self.chunk[self.chunk_length]
+        record['timestamp'] = result.timestamp
+        record['roi'] = result.roi
+        record['handedness'] = -1
+        record['scores'] = 0
+        hands = (result.multi_hand_landmarks or [])[:self.max_hands]
+        record['num_hands'] = len(hands)
+        for hand_index, hand in enumerate(hands):
+            record['landmarks'][hand_index] = [(landmark.x, landmark.y, landmark.z) for landmark in hand.landmark]
+            if result.multi_handedness:
+                classification = result.multi_handedness[hand_index].classification[0]
+                record['handedness'][hand_index] = HANDEDNESS_LABELS.index(classification.label)
+                record['scores'][hand_index] = classification.score
+
+        self.chunk_length += 1
+        self.recorded += 1
+        if self.chunk_length == RECORD_CHUNK_SIZE:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered records to the file"""
+        self.file.write(self.chunk[:self.chunk_length].tobytes())
+        self.file.flush()
+        self.chunk_length = 0
+
+    def close(self):
+        """Write any buffered records and close the file"""
+        self.flush()
+        self.file.close()
+
+class TrackingRecording:
+    def __init__(self, path):
+        """Open a recording for reading; records are memory-mapped, not loaded"""
+        header = np.fromfile(path, dtype=_HEADER_DTYPE, count=1)
+        if len(header) == 0 or header['magic'][0] != RECORDING_MAGIC:
+            raise ValueError(f"{path} is not a hand tracking recording")
+        version = int(header['version'][0])
+        if version != RECORDING_VERSION:
+            raise ValueError(f"{path} is a version {version} recording, only version {RECORDING_VERSION} can be read")
+        self.max_hands = int(header['max_hands'][0])
+        self.dtype = record_dtype(self.max_hands, int(header['num_landmarks'][0]))
+
+        # A recording cut short by a crash may end in a partial record, which is ignored
+        with open(path, 'rb') as recording_file:
+            recording_file.seek(0, 2)
+            count = (recording_file.tell() - _HEADER_DTYPE.itemsize) // self.dtype.itemsize
+        if count > 0:
+            self.records = np.memmap(path, dtype=self.dtype, mode='r', offset=_HEADER_DTYPE.itemsize, shape=(count,))
+        else:
+            self.records = np.zeros(0, dtype=self.dtype)
+        # Strided view into the map; binary searches on it only touch a few pages
+        self.timestamps = self.records['timestamp']
+
+    def __len__(self):
+        return len(self.records)
+
+    @property
+    def start_time(self):
+        return float(self.timestamps[0]) if len(self) else 0.0
+
+    @property
+    def duration(self):
+        """Seconds between the first and the last record"""
+        return float(self.timestamps[-1] - self.timestamps[0]) if len(self) else 0.0
+
+    def find(self, timestamp):
+        """Index of the last record at or before `timestamp`, or -1"""
+        return int(np.searchsorted(self.timestamps, timestamp, side='right')) - 1
+
+    def get_result(self, index, time_offset=0.0):
+        """Rebuild the TrackingResult of a record, with its timestamp shifted by `time_offset`"""
+        record = self.records[index]
+        num_hands = int(record['num_hands'])
+        hands, handedness = [], []
+        for hand_index in range(num_hands):
+            hands.append(HandLandmarks([Landmark(*point) for point in record['landmarks'][hand_index].tolist()]))
+            label = int(record['handedness'][hand_index])
+            if label >= 0:
+                score = float(record['scores'][hand_index])
+                handedness.append(Handedness([Classification(label, score, HANDEDNESS_LABELS[label])]))
+
+        # Like MediaPipe, no hands means None rather than empty lists
+        results = HandResults(hands or None, handedness if hands and len(handedness) == num_hands else None)
+        return TrackingResult(results, float(record['timestamp']) + time_offset, tuple(record['roi'].tolist()))
+
+    def get_fingertip(self, index, hand=0):
+        """Frame pixel position of a hand's index finger tip in a record, or None if it was not tracked"""
+        record = self.records[index]
+        if record['num_hands'] <= hand:
+            return None
+        roi_x, roi_y, roi_w, roi_h = record['roi'].tolist()
+        x, y = record['landmarks'][hand, INDEX_FINGER_TIP, :2].tolist()
+        return (roi_x + x * roi_w, roi_y + y * roi_h)
+
+class ReplayTrajectory:
+    def __init__(self, recording, hand=0):
+        """Paddle input for headless runs, read from a recording; t = 0 is the first record"""
+        self.recording = recording
+        self.hand = hand
+
+    def __call__(self, t):
+        index = self.recording.find(self.recording.start_time + t)
+        return self.recording.get_fingertip(index, self.hand) if index >= 0 else None
+
+class ReplayTracker(HandTracker):
+    def __init__(self, recording):
+        """Hand tracker that plays back a recording instead of running MediaPipe
+
+        Recorded time is mapped onto the clock of the first frame processed
+        """
+        super().__init__(mode='sync', load_model=False)
+        self.recording = recording
+        self.time_offset = None
+        self._index = -1
+        self._result = None
+
+    def process_frame(self, frame, timestamp=None):
+        """Return the last recorded result at the frame's time (the frame itself is ignored)"""
+        if timestamp is None:
+            timestamp = time.time()
+        if self.time_offset is None:
+            self.time_offset = timestamp - self.recording.start_time
+
+        index = self.recording.find(timestamp - self.time_offset)
+        if index != self._index:
+            # Results are rebuilt once per record, so repeats keep their timestamp like async results do
+            self._index = index
+            self._result = self.recording.get_result(index, self.time_offset) if index >= 0 else None
+        return self._result
+
+class ReplaySource(SyntheticSource):
+    def __init__(self, recording, fps=30):
+        """Blank camera frames for the length of a recording, so a replay ends with it"""
+        super().__init__(fps=fps, num_frames=math.ceil(recording.duration * fps) + 1)
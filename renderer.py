@@ -1,108 +1,164 @@
+import os
 import cv2
 import numpy as np
 from config import *
+from sprites import AlphaSprite, CircleSprite, TextSprite
 
 class Renderer:
-    def __init__(self):
-        """Initialize renderer and load target image"""
+    def __init__(self, target_size=TARGET_SIZE):
+        """Initialize renderer and load the target image, scaled to `target_size` pixels"""
+        self.target_size = target_size
         self.target_image = self._load_target_image()
+        # Blend planes of the target image, computed once instead of every frame
+        self.target_sprite = AlphaSprite(self.target_image)
+        # Circle sprites keyed by (radius, color), built on first use
+        self.circle_sprites = {}
+        # HUD element name -> (value, TextSprite) it was last laid out and rendered for
+        self.hud_sprites = {}
+        # HUD element name -> (value, texts) it was last laid out for, for texts drawn with putText
+        self.hud_layouts = {}
         
     def _load_target_image(self):
-        """Load and prepare target image"""
-        target_image = cv2.resize(cv2.imread('target.png'), (TARGET_SIZE, TARGET_SIZE))
-        return cv2.cvtColor(target_image, cv2.COLOR_RGB2RGBA)
+        """Load the target image resized to the target size as RGBA, from the asset cache if it is there"""
+        # The source's size and modification time are part of the name, so edits invalidate it
+        cache_path = None
+        if ASSET_CACHE_DIR:
+            stat = os.stat(TARGET_IMAGE_PATH)
+            cache_path = os.path.join(ASSET_CACHE_DIR, f'target_{self.target_size}_{stat.st_size}_{stat.st_mtime_ns}.npy')
+            if os.path.exists(cache_path):
+                return np.load(cache_path)
+
+        source = cv2.imread(TARGET_IMAGE_PATH)
+        if source is None:
+            raise FileNotFoundError(f"Could not read the target image {TARGET_IMAGE_PATH}")
+        target_image = cv2.cvtColor(cv2.resize(source, (self.target_size, self.target_size)), cv2.COLOR_RGB2RGBA)
+
+        if cache_path is not None:
+            try:
+                os.makedirs(ASSET_CACHE_DIR, exist_ok=True)
+                # Written under a temporary name and renamed, so concurrent games never read half a file
+                temporary_path = f'{cache_path}.{os.getpid()}.tmp'
+                with open(temporary_path, 'wb') as cache_file:
+                    np.save(cache_file, target_image)
+                os.replace(temporary_path, cache_path)
+            except OSError as error:
+                # A read-only install still works, just without the cache
+                print(f"Could not cache the target image: {error}")
+        return target_image
+    
+    def _get_circle_sprite(self, radius, color):
+        """Return the cached circle sprite for a (radius, color) pair"""
+        key = (radius, tuple(color))
+        if key not in self.circle_sprites:
+            self.circle_sprites[key] = CircleSprite(radius, color)
+        return self.circle_sprites[key]
+    
+    def _draw_hud_element(self, image, name, value, layout):
+        """Draw a HUD element, laid out by `layout(value)` and rendered only when its value changes"""
+        cached = self.hud_sprites.get(name)
+        if cached is None or cached[0] != value:
+            cached = self.hud_sprites[name] = (value, TextSprite(layout(value)))
+        cached[1].draw(image)
+    
+    def _draw_hud_text(self, image, name, value, layout):
+        """Draw a HUD element with cv2.putText, laid out by `layout(value)` only when its value changes
+
+        Short texts are cheaper to draw with putText than to composite from a sprite, so only
+        their measurements are cached
+        """
+        cached = self.hud_layouts.get(name)
+        if cached is None or cached[0] != value:
+            cached = self.hud_layouts[name] = (value, layout(value))
+        for text, origin, font_scale, color, thickness in cached[1]:
+            cv2.putText(image, text, origin, cv2.FONT_HERSHEY_SIMPLEX, font_scale, color, thickness, cv2.LINE_AA)
     
     def overlay_circle(self, image, obj_position, radius, color):
         """Overlay a circular object on the image"""
-        # Extract a square around the center of the object
-        obj_roi = image[(obj_position[1] - radius):(obj_position[1] + (radius+1)),
-                       (obj_position[0] - radius):(obj_position[0] + (radius+1))]
-        
-        side_sq = 2 * radius + 1
-        
-        for y in range(side_sq):
-            for x in range(side_sq):
-                # Check if pixel lies within the circle
-                if ((y-radius)**2 + (x-radius)**2) <= radius**2:
-                    obj_roi[y, x] = np.array(color)
+        # Parts of the circle outside the frame are clipped instead of wrapping around
+        self._get_circle_sprite(radius, color).draw(image, obj_position)
     
     def overlay_targets(self, image, targets):
         """Overlay target images on the frame"""
-        for target in targets:
-            if target.hit:
-                continue
-                
-            # Extract region of interest
-            target_roi = image[target.position[1]: (target.position[1] + self.target_image.shape[0]),
-                              target.position[0]: (target.position[0] + self.target_image.shape[1])]
-            
-            # Calculate opacity
-            opacity = self.target_image[:, :, 3] / 255.0
-            transparency = 1.0 - opacity
-            
-            # Overlay target image onto frame
-            for color_code in range(3):
-                target_roi[:, :, color_code] = (
-                    opacity * self.target_image[:, :, color_code] +
-                    transparency * target_roi[:, :, color_code]
-                )
+        positions = [target.position for target in targets if not target.hit]
+        
+        # Large target fields are blended in one batched gather/scatter
+        if len(positions) >= BATCH_BLEND_MIN_TARGETS:
+            self.target_sprite.draw_batch(image, positions)
+            return
+        
+        for position in positions:
+            self.target_sprite.draw(image, position)
     
     def draw_ui(self, image, score, remaining_time, game_over):
         """Draw UI elements (score and timer) with improved style and clamped positions"""
         # Score (top right)
-        score_text = f'Score: {score}'
-        (w, h), _ = cv2.getTextSize(score_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, FONT_THICKNESS)
-        score_x = min(max(int(VIDEO_X*0.8), 0), VIDEO_X - w - 20)
-        score_y = max(int(VIDEO_Y*0.1), h + 20)
-        cv2.putText(image, score_text, (score_x, score_y), cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, WHITE_TEXT, FONT_THICKNESS, cv2.LINE_AA)
+        self._draw_hud_text(image, 'score', score, self._layout_score)
 
-        # Timer (top center)
+        # Timer (top center). Its text changes every frame, so a cached sprite would never be reused
         timer_text = f'{round(remaining_time, 2) if not game_over else "--"} secs'
         (tw, th), _ = cv2.getTextSize(timer_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, FONT_THICKNESS)
         timer_x = min(max(int(VIDEO_X*0.5 - tw/2), 0), VIDEO_X - tw - 20)
         timer_y = max(int(VIDEO_Y*0.1), th + 20)
         cv2.putText(image, timer_text, (timer_x, timer_y), cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, WHITE_TEXT, FONT_THICKNESS, cv2.LINE_AA)
     
+    def _layout_score(self, score):
+        """Score text and its position in the top right"""
+        score_text = f'Score: {score}'
+        (w, h), _ = cv2.getTextSize(score_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE, FONT_THICKNESS)
+        score_x = min(max(int(VIDEO_X*0.8), 0), VIDEO_X - w - 20)
+        score_y = max(int(VIDEO_Y*0.1), h + 20)
+        return [(score_text, (score_x, score_y), FONT_SCALE, WHITE_TEXT, FONT_THICKNESS)]
+    
+    def draw_profiler_overlay(self, image, stats):
+        """Draw per-stage p50/p95/p99 frame times (in ms) in the bottom-left corner"""
+        lines = [f'{"stage":<10} p50 / p95 / p99 ms']
+        lines += [f'{name:<10} {p50 * 1e3:5.1f} / {p95 * 1e3:5.1f} / {p99 * 1e3:5.1f}' for name, (p50, p95, p99) in stats.items()]
+        line_height = 16
+        top = VIDEO_Y - line_height * len(lines) - 8
+        # Darken the area behind the text so it stays readable on any background
+        image[max(top - line_height, 0):, :260] //= 3
+        for row, line in enumerate(lines):
+            cv2.putText(image, line, (8, top + row * line_height), cv2.FONT_HERSHEY_PLAIN, 1.0, WHITE_TEXT, 1, cv2.LINE_AA)
+    
     def draw_game_over(self, image, score):
         """Draw game over screen with big, bold, centered red text and shadow, clamped to image bounds"""
-        main_text = 'YOU LOSE!'
-        score_text = f'Your Score: {score}'
-        (w, h), _ = cv2.getTextSize(main_text, cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, BOLD_FONT_THICKNESS)
-        x = max(int((VIDEO_X - w) / 2), 0)
-        y = max(int((VIDEO_Y) / 2), h)
-        x = min(x, VIDEO_X - w)
-        y = min(y, VIDEO_Y - h)
-        # Shadow
-        cv2.putText(image, main_text, (x+3, y+3), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, (0,0,0), BOLD_FONT_THICKNESS+2, cv2.LINE_AA)
-        # Main
-        cv2.putText(image, main_text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, RED_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA)
-        # Score below
-        (sw, sh), _ = cv2.getTextSize(score_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, BOLD_FONT_THICKNESS)
-        sx = max(int((VIDEO_X - sw) / 2), 0)
-        sy = min(y + h + 30, VIDEO_Y - sh)
-        cv2.putText(image, score_text, (sx, sy), cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, WHITE_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA)
+        self._draw_hud_element(image, 'game_over', score, lambda score: self._layout_end_screen('YOU LOSE!', RED_TEXT, [f'Your Score: {score}']))
     
     def draw_victory(self, image, score, completion_time):
         """Draw victory screen with big, bold, centered green text and show completion time, clamped to image bounds"""
-        main_text = 'YOU WON!'
-        score_text = f'Your Score: {score}'
-        time_text = f'Time: {round(completion_time, 2)}s'
+        self._draw_hud_element(image, 'victory', (score, completion_time), lambda value: self._layout_end_screen(
+            'YOU WON!', GREEN_TEXT, [f'Your Score: {value[0]}', f'Time: {round(value[1], 2)}s']))
+    
+    def draw_attract(self, image, hold_fraction):
+        """Draw the attract screen, with a bar showing how far along holding up a hand to start is (0 to 1)"""
+        self._draw_hud_element(image, 'attract', None, lambda value: self._layout_end_screen(
+            'AIR HOCKEY', WHITE_TEXT, ['Hold up a hand to play']))
+        # Bar in the lower part of the frame, filling up from the left
+        x0, x1 = VIDEO_X // 4, VIDEO_X * 3 // 4
+        y0, y1 = int(VIDEO_Y * 0.8), int(VIDEO_Y * 0.8) + 12
+        cv2.rectangle(image, (x0, y0), (x1, y1), WHITE_TEXT, 2)
+        if hold_fraction > 0:
+            cv2.rectangle(image, (x0, y0), (x0 + int((x1 - x0) * min(hold_fraction, 1)), y1), GREEN_TEXT, -1)
+    
+    def _layout_end_screen(self, main_text, main_color, lines):
+        """Texts and positions of an end screen: centered main text with a shadow, then lines below it"""
         (w, h), _ = cv2.getTextSize(main_text, cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, BOLD_FONT_THICKNESS)
         x = max(int((VIDEO_X - w) / 2), 0)
         y = max(int((VIDEO_Y) / 2), h)
         x = min(x, VIDEO_X - w)
         y = min(y, VIDEO_Y - h)
-        # Shadow
-        cv2.putText(image, main_text, (x+3, y+3), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, (0,0,0), BOLD_FONT_THICKNESS+2, cv2.LINE_AA)
-        # Main
-        cv2.putText(image, main_text, (x, y), cv2.FONT_HERSHEY_SIMPLEX, LARGE_FONT_SCALE, GREEN_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA)
-        # Score below
-        (sw, sh), _ = cv2.getTextSize(score_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, BOLD_FONT_THICKNESS)
-        sx = max(int((VIDEO_X - sw) / 2), 0)
-        sy = min(y + h + 30, VIDEO_Y - sh)
-        cv2.putText(image, score_text, (sx, sy), cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, WHITE_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA)
-        # Time below score
-        (tw, th), _ = cv2.getTextSize(time_text, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, BOLD_FONT_THICKNESS)
-        tx = max(int((VIDEO_X - tw) / 2), 0)
-        ty = min(sy + sh + 20, VIDEO_Y - th)
-        cv2.putText(image, time_text, (tx, ty), cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, WHITE_TEXT, BOLD_FONT_THICKNESS, cv2.LINE_AA) 
\ No newline at end of file
+        texts = [
+            # Shadow, then main
+            (main_text, (x+3, y+3), LARGE_FONT_SCALE, (0,0,0), BOLD_FONT_THICKNESS+2),
+            (main_text, (x, y), LARGE_FONT_SCALE, main_color, BOLD_FONT_THICKNESS),
+        ]
+        
+        # Each line below the previous one: 30 pixels below the main text, then 20
+        bottom, gap = y + h, 30
+        for line in lines:
+            (lw, lh), _ = cv2.getTextSize(line, cv2.FONT_HERSHEY_SIMPLEX, FONT_SCALE*2, BOLD_FONT_THICKNESS)
+            lx = max(int((VIDEO_X - lw) / 2), 0)
+            ly = min(bottom + gap, VIDEO_Y - lh)
+            texts.append((line, (lx, ly), FONT_SCALE*2, WHITE_TEXT, BOLD_FONT_THICKNESS))
+            bottom, gap = ly + lh, 20
+        return texts
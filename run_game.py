@@ -2,12 +2,14 @@
 Simple launcher for the Air Hockey Game
 """
 
+from config import KIOSK_MODE
 from air_hockey_game import AirHockeyGame
+from session import SessionManager
 
 def main():
-    """Launch the air hockey game"""
+    """Launch the air hockey game (game after game in KIOSK_MODE)"""
     try:
-        game = AirHockeyGame()
+        game = SessionManager() if KIOSK_MODE else AirHockeyGame()
         game.run()
     except KeyboardInterrupt:
         print("\nGame interrupted by user")
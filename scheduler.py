@@ -0,0 +1,53 @@
+import math
+from config import *
+
+class InferenceScheduler:
+    def __init__(self, target_frame_time=TARGET_FRAME_TIME, budget=INFERENCE_BUDGET,
+                 max_interval=INFERENCE_MAX_INTERVAL, motion_tolerance=INFERENCE_MOTION_TOLERANCE):
+        """Decide on which frames hand tracking inference runs: every `interval`-th frame
+
+        The interval grows until inference costs at most `budget` of the target frame time on
+        average, and shrinks while the fingertip moves fast, so that it never moves more than
+        about `motion_tolerance` pixels between inferences. It never exceeds `max_interval`.
+        While no hand is tracked only the budget counts, so a hand entering the frame is found
+        as soon as the budget allows.
+        """
+        self.target_frame_time = target_frame_time
+        self.budget = budget
+        self.max_interval = max_interval
+        self.motion_tolerance = motion_tolerance
+
+        # Smoothed inference latency in seconds, and the fastest tracked fingertip in pixels/sec
+        # (None while no hand is tracked)
+        self.latency = 0.0
+        self.speed = None
+        self.interval = 1
+        self.frames_since_inference = 0
+
+    def record_latency(self, seconds):
+        """Add a measured inference time"""
+        self.latency = seconds if self.latency == 0 else 0.8 * self.latency + 0.2 * seconds
+
+    def record_motion(self, speed):
+        """Set the current fingertip speed (the fastest hand, None if none is tracked)"""
+        self.speed = speed
+
+    def should_run(self):
+        """Whether inference should run on the current frame; call once per frame"""
+        # Frames whose inference share would blow the budget, and frames the hand may move over
+        latency_interval = math.ceil(self.latency / (self.budget * self.target_frame_time))
+        if self.speed is None:
+            # Nothing to follow between inferences: search for hands as often as the budget allows
+            motion_interval = 1
+        elif self.speed > 0:
+            motion_interval = math.floor(self.motion_tolerance / (self.speed * self.target_frame_time))
+        else:
+            motion_interval = self.max_interval
+        # Keeping the frame rate wins over tracking accuracy
+        self.interval = min(max(motion_interval, latency_interval, 1), self.max_interval)
+
+        self.frames_since_inference += 1
+        if self.frames_since_inference >= self.interval:
+            self.frames_since_inference = 0
+            return True
+        return False
@@ -0,0 +1,119 @@
+"""
+Kiosk sessions
+
+Plays game after game on the same camera, hand tracker and renderer, so a new
+player never waits for the camera or the hand model to start up again; only
+the game entities are reset. Between games an attract screen invites the next
+player while hand tracking runs at a reduced rate. Holding up a hand for
+SESSION_START_HOLD seconds (or pressing space) starts a game.
+"""
+
+from config import *
+from air_hockey_game import AirHockeyGame
+
+class SessionManager(AirHockeyGame):
+    def __init__(self, max_sessions=None, start_hold=SESSION_START_HOLD, end_screen_duration=END_SCREEN_DURATION,
+                 abandon_timeout=SESSION_ABANDON_TIMEOUT, on_frame=None, on_session_start=None, **options):
+        """Set up the game once for any number of sessions; stop after `max_sessions` games if given
+
+        `on_frame()` is called before each frame is read and `on_session_start(session)` as each game
+        starts, with its number. Other keywords (camera, hand_tracker, clock) go to AirHockeyGame.
+        """
+        super().__init__(**options)
+        self.max_sessions = max_sessions
+        self.on_frame = on_frame
+        self.on_session_start = on_session_start
+        self.start_hold = start_hold
+        self.end_screen_duration = end_screen_duration
+        self.abandon_timeout = abandon_timeout
+        self.sessions = 0
+        self.playing = False
+        # Since when a hand has been held up on the attract screen, without a gap
+        self.hand_seen_since = None
+        # When a hand was last tracked in game, and when the game ended
+        self.last_hand_time = None
+        self.game_over_time = None
+
+    def run(self):
+        """Alternate between the attract screen and games until 'q' is pressed"""
+        if not self.camera.is_opened():
+            print("Error: Could not open camera")
+            return
+
+        print("Air Hockey kiosk started!")
+        print("Hold up a hand (or press space) to start a game")
+        print("Press 'q' to quit")
+        self._enter_attract()
+        while True:
+            if self.on_frame is not None:
+                self.on_frame()
+            frame = self.read_frame()
+            if frame is None:
+                break
+
+            paddle_positions, current_time = self.track_hands(frame)
+            hand_visible = any(position is not None for position in paddle_positions)
+            if self.playing:
+                self._play_frame(frame, paddle_positions, current_time, hand_visible)
+            else:
+                self._attract_frame(frame, current_time, hand_visible)
+            key = self.show(frame)
+
+            if key == ord('q'):
+                break
+            if key == ord(' ') and not self.playing:
+                self._start_session(current_time)
+            if not self.playing and self.max_sessions is not None and self.sessions >= self.max_sessions:
+                break
+
+        self.close()
+        print(f"Sessions played: {self.sessions}")
+
+    def _start_session(self, current_time):
+        """Reset the game entities in place and start a game"""
+        self.simulation.reset()
+        self.previous_time = current_time
+        self.hand_tracker.idle = False
+        self.playing = True
+        self.sessions += 1
+        self.last_hand_time = current_time
+        self.game_over_time = None
+        if self.on_session_start is not None:
+            self.on_session_start(self.sessions)
+
+    def _enter_attract(self):
+        """Show the attract screen, tracking hands at a reduced rate"""
+        self.playing = False
+        self.hand_tracker.idle = True
+        self.hand_seen_since = None
+
+    def _attract_frame(self, image, current_time, hand_visible):
+        """Wait for a player to hold up a hand, and start a game once they have for long enough"""
+        if not hand_visible:
+            self.hand_seen_since = None
+        elif self.hand_seen_since is None:
+            self.hand_seen_since = current_time
+        hold_fraction = (current_time - self.hand_seen_since) / self.start_hold if hand_visible else 0
+
+        with self.profiler.span('ui'):
+            self.renderer.draw_attract(image, hold_fraction)
+        if hold_fraction >= 1:
+            self._start_session(current_time)
+
+    def _play_frame(self, image, paddle_positions, current_time, hand_visible):
+        """Play one frame; return to the attract screen after the end screen, or when the player left"""
+        self.update_game(paddle_positions, current_time)
+        self.draw_game(image, current_time)
+
+        if self.game_state.game_over:
+            if self.game_over_time is None:
+                self.game_over_time = current_time
+                print(f"Game {self.sessions}: score {self.game_state.score}" +
+                      (f", won in {self.game_state.game_won_time}s" if self.game_state.victory else ""))
+            if current_time - self.game_over_time > self.end_screen_duration:
+                self._enter_attract()
+        elif hand_visible:
+            self.last_hand_time = current_time
+        elif current_time - self.last_hand_time > self.abandon_timeout:
+            print(f"Game {self.sessions}: abandoned")
+            self._enter_attract()
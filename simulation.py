@@ -0,0 +1,82 @@
+import time
+import numpy as np
+from config import *
+from game_objects import PuckSet, PaddleSet, TargetManager
+from physics import FixedTimestep, PhysicsEngine
+from game_state import GameState
+from profiler import NullProfiler
+
+class GameSimulation:
+    def __init__(self, clock=time.time, rng=np.random, num_pucks=NUM_PUCKS, num_targets=NUM_TARGETS, profiler=None,
+                 num_paddles=MAX_NUM_HANDS, initial_puck_velocity=INITIAL_PUCK_VELOCITY,
+                 puck_smoothing_factor=PUCK_SMOOTHING_FACTOR, increase_speed_factor=INCREASE_SPEED_FACTOR,
+                 target_size=TARGET_SIZE, game_duration=GAME_DURATION):
+        """Game entities and their per-frame update, shared by the live game and headless runs
+
+        `clock` supplies the game time and `rng` the random layout (np.random or a seeded RandomState).
+        The game settings are named after, and default to, their constants in config.py, so
+        games with different settings can run side by side.
+        """
+        self.rng = rng
+        self.pucks = PuckSet(num_pucks, rng, initial_puck_velocity, puck_smoothing_factor, increase_speed_factor)
+        self.paddles = PaddleSet(num_paddles)
+        self.target_manager = TargetManager(num_targets, rng, target_size)
+        self.physics = PhysicsEngine()
+        self.timestep = FixedTimestep()
+        self.game_state = GameState(clock, game_duration)
+        self.profiler = profiler or NullProfiler()
+        # Physics steps run and paddle hits, for statistics
+        self.steps = 0
+        self.paddle_hits = 0
+    
+    def reset(self):
+        """Start a new game on the same entities: new layout from `rng`, and the clock restarts now"""
+        self.pucks.reset(self.rng)
+        self.paddles.reset()
+        self.target_manager.reset()
+        self.timestep.reset()
+        self.game_state.reset()
+        self.steps = 0
+        self.paddle_hits = 0
+    
+    def update(self, frame_time, paddle_positions):
+        """Move each paddle to its entry of `paddle_positions` (None if not tracked) and simulate `frame_time` seconds"""
+        self.paddles.update_positions(paddle_positions, self.game_state.clock())
+        
+        # Run as many fixed physics steps as the real time since the last frame covers
+        steps = self.timestep.advance(frame_time)
+        # Only the paddles of tracked hands are in play; the others are parked, not obstacles
+        tracked = self.paddles.tracked
+        # Filters that model the hand's motion give the paddle's true velocity for collisions
+        paddle_velocities = self.paddles.velocities[tracked] if self.paddles.estimator.models_velocity else None
+        for step in range(steps):
+            with self.profiler.span('physics'):
+                # The paddles' motion since the last step is spread evenly over this frame's steps
+                paddle_start = self.paddles.get_swept_positions(step / steps)[tracked]
+                paddle_end = self.paddles.get_swept_positions((step + 1) / steps)[tracked]
+                hits = self.physics.step(self.pucks, self.paddles, self.timestep.dt, paddle_start, paddle_end, paddle_velocities)
+                self.paddle_hits += int(np.count_nonzero(hits))
+            
+            # Check target collisions
+            with self.profiler.span('collisions'):
+                newly_hit_targets = self.target_manager.check_collisions(self.pucks)
+            for target in newly_hit_targets:
+                self.game_state.add_score()
+                # NEEDS TO BE TESTED --- Might not work properly in this context
+                self.pucks.increase_velocity()
+        if steps:
+            self.paddles.previous_positions[:] = self.paddles.positions
+        self.steps += steps
+        
+        # Check game end conditions
+        self.game_state.check_game_end(self.target_manager.all_targets_hit())
+        return steps
+    
+    def render(self, image, renderer):
+        """Draw targets, pucks and the paddles of tracked hands onto `image`"""
+        with self.profiler.span('render'):
+            renderer.overlay_targets(image, self.target_manager.get_active_targets())
+            for puck_position in self.pucks.get_render_positions(self.timestep.alpha):
+                renderer.overlay_circle(image, puck_position, self.pucks.radius, PUCK_COLOR)
+            for index, paddle_position in zip(np.flatnonzero(self.paddles.tracked), self.paddles.positions[self.paddles.tracked]):
+                renderer.overlay_circle(image, paddle_position, self.paddles.radius, PADDLE_COLORS[index % len(PADDLE_COLORS)])
@@ -0,0 +1,78 @@
+import math
+import numpy as np
+
+# Offset that keeps packed cell y coordinates in the low 32 bits non-negative
+_KEY_BIAS = 1 << 31
+
+class UniformGrid:
+    def __init__(self, cell_size):
+        """Spatial hash of axis-aligned boxes over square cells of `cell_size` pixels"""
+        self.cell_size = cell_size
+        # (cell_x, cell_y) -> set of items overlapping that cell
+        self.cells = {}
+        # item -> cells it was inserted into, so it can be removed without a search
+        self.item_cells = {}
+
+    def _cell_range(self, x0, y0, x1, y1):
+        """Yield every cell overlapped by the box (x0, y0)-(x1, y1)"""
+        for cell_x in range(math.floor(x0 / self.cell_size), math.floor(x1 / self.cell_size) + 1):
+            for cell_y in range(math.floor(y0 / self.cell_size), math.floor(y1 / self.cell_size) + 1):
+                yield (cell_x, cell_y)
+
+    def insert(self, item, x0, y0, x1, y1):
+        """Add an item covering the box (x0, y0)-(x1, y1)"""
+        cells = list(self._cell_range(x0, y0, x1, y1))
+        for cell in cells:
+            self.cells.setdefault(cell, set()).add(item)
+        self.item_cells[item] = cells
+
+    def remove(self, item):
+        """Remove an item from every cell it was inserted into"""
+        for cell in self.item_cells.pop(item, ()):
+            members = self.cells[cell]
+            members.discard(item)
+            if not members:
+                del self.cells[cell]
+
+    def query(self, x0, y0, x1, y1):
+        """Return the set of items in cells overlapped by the box (x0, y0)-(x1, y1)"""
+        found = set()
+        for cell in self._cell_range(x0, y0, x1, y1):
+            members = self.cells.get(cell)
+            if members:
+                found |= members
+        return found
+
+    def query_many(self, boxes):
+        """Return the set of items in cells overlapped by any of the (N * 4) boxes [x0, y0, x1, y1]"""
+        if len(boxes) == 1:
+            return self.query(*boxes[0])
+
+        cells = np.floor(np.asarray(boxes) / self.cell_size).astype(np.int64)
+        span_x = cells[:, 2] - cells[:, 0]
+        span_y = cells[:, 3] - cells[:, 1]
+
+        # Enumerate the cells of all boxes at once, one offset inside the boxes at a time.
+        # Cells are packed into single integers so duplicates can be dropped with a 1D unique.
+        keys = []
+        for dx in range(span_x.max() + 1):
+            for dy in range(span_y.max() + 1):
+                inside = (dx <= span_x) & (dy <= span_y)
+                keys.append(((cells[inside, 0] + dx) << 32) + (cells[inside, 1] + dy + _KEY_BIAS))
+        keys = np.unique(np.concatenate(keys))
+
+        found = set()
+        for key in keys.tolist():
+            members = self.cells.get((key >> 32, (key & 0xFFFFFFFF) - _KEY_BIAS))
+            if members:
+                found |= members
+        return found
+
+    def clear(self):
+        """Remove every item"""
+        self.cells.clear()
+        self.item_cells.clear()
+
+    def __len__(self):
+        """Number of items in the grid"""
+        return len(self.item_cells)
@@ -0,0 +1,139 @@
+import cv2
+import numpy as np
+from numpy.lib.stride_tricks import as_strided
+
+def clip_box(image_shape, x, y, width, height):
+    """Clip a box with top-left corner (x, y) against the image bounds
+
+    Returns a pair of (image slices, sprite slices) or None if the box is fully off-screen
+    """
+    image_h, image_w = image_shape[:2]
+    x0, y0 = max(x, 0), max(y, 0)
+    x1, y1 = min(x + width, image_w), min(y + height, image_h)
+    if x0 >= x1 or y0 >= y1:
+        return None
+
+    image_slices = (slice(y0, y1), slice(x0, x1))
+    sprite_slices = (slice(y0 - y, y1 - y), slice(x0 - x, x1 - x))
+    return image_slices, sprite_slices
+
+class CircleSprite:
+    def __init__(self, radius, color):
+        """Precompute the boolean mask of a filled circle and its fill color"""
+        self.radius = radius
+        self.side = 2 * radius + 1
+        # Offsets from the center along each axis, broadcast into a (side x side) grid
+        dy, dx = np.ogrid[-radius:radius + 1, -radius:radius + 1]
+        self.mask = (dx ** 2 + dy ** 2) <= radius ** 2
+        self.color = np.array(color, dtype=np.uint8)
+
+    def draw(self, image, center):
+        """Fill the circle centered at `center` with a single masked assignment"""
+        x = int(round(center[0])) - self.radius
+        y = int(round(center[1])) - self.radius
+
+        clipped = clip_box(image.shape, x, y, self.side, self.side)
+        if clipped is None:
+            return
+        image_slices, sprite_slices = clipped
+
+        # Basic slicing returns a view, so the masked assignment writes into the frame
+        image[image_slices][self.mask[sprite_slices]] = self.color
+
+class AlphaSprite:
+    def __init__(self, rgba):
+        """Precompute premultiplied color and inverse alpha planes of an RGBA image"""
+        alpha = rgba[:, :, 3:4].astype(np.float32) / 255.0
+        self.height, self.width = rgba.shape[:2]
+        self.premultiplied = rgba[:, :, :3].astype(np.float32) * alpha
+        self.inverse_alpha = 1.0 - alpha
+        # Fully opaque sprites (the usual case for target.png) are a plain copy
+        self.opaque = bool(np.all(alpha == 1.0))
+        self.color = rgba[:, :, :3].copy()
+
+    def draw(self, image, position):
+        """Alpha blend the sprite with its top-left corner at `position`"""
+        clipped = clip_box(image.shape, int(position[0]), int(position[1]), self.width, self.height)
+        if clipped is None:
+            return
+        image_slices, sprite_slices = clipped
+        roi = image[image_slices]
+
+        if self.opaque:
+            roi[:] = self.color[sprite_slices]
+        else:
+            # out = color * alpha + background * (1 - alpha), over all channels at once
+            roi[:] = self.premultiplied[sprite_slices] + self.inverse_alpha[sprite_slices] * roi
+
+    def draw_batch(self, image, positions):
+        """Alpha blend the sprite at many top-left positions with one gather and one scatter
+
+        Sprites are blended against the original background, so where two of them
+        overlap the later one wins instead of being blended over the earlier one
+        """
+        positions = np.asarray(positions, dtype=np.intp).reshape(-1, 2)
+        image_h, image_w = image.shape[:2]
+        inside = ((positions[:, 0] >= 0) & (positions[:, 0] + self.width <= image_w) &
+                  (positions[:, 1] >= 0) & (positions[:, 1] + self.height <= image_h))
+
+        # Sprites crossing the frame edge need clipping, so they take the single-sprite path
+        for position in positions[~inside]:
+            self.draw(image, position)
+
+        positions = positions[inside]
+        if len(positions) == 0:
+            return
+
+        # Writable (rows, cols, h, w, 3) view of every sprite-sized window of the frame,
+        # so fancy indexing by top-left corner gathers and scatters whole sprite blocks
+        row_stride, col_stride, channel_stride = image.strides
+        windows = as_strided(image,
+                             shape=(image_h - self.height + 1, image_w - self.width + 1, self.height, self.width, image.shape[2]),
+                             strides=(row_stride, col_stride, row_stride, col_stride, channel_stride),
+                             writeable=True)
+        ys, xs = positions[:, 1], positions[:, 0]
+
+        if self.opaque:
+            windows[ys, xs] = self.color
+        else:
+            patches = windows[ys, xs].astype(np.float32)
+            patches *= self.inverse_alpha
+            patches += self.premultiplied
+            windows[ys, xs] = patches
+
+class TextSprite:
+    def __init__(self, texts, font=cv2.FONT_HERSHEY_SIMPLEX):
+        """Render anti-aliased texts once into a sprite placed on the frame
+
+        `texts` is a list of (text, origin, font_scale, color, thickness) drawn in order, like
+        cv2.putText with cv2.LINE_AA. They are drawn onto black, which gives their colors
+        premultiplied by coverage, and in white onto black, which gives the coverage itself.
+        """
+        boxes = []
+        for text, (x, y), font_scale, color, thickness in texts:
+            (width, height), baseline = cv2.getTextSize(text, font, font_scale, thickness)
+            # Strokes reach past the measured box by about half their thickness
+            pad = thickness // 2 + 2
+            boxes.append((x - pad, y - height - pad, x + width + pad, y + baseline + pad))
+        x0, y0 = min(box[0] for box in boxes), min(box[1] for box in boxes)
+        x1, y1 = max(box[2] for box in boxes), max(box[3] for box in boxes)
+        self.position = (x0, y0)
+
+        self.premultiplied = np.zeros((y1 - y0, x1 - x0, 3), dtype=np.uint8)
+        self.coverage = np.zeros_like(self.premultiplied)
+        for text, (x, y), font_scale, color, thickness in texts:
+            origin = (x - x0, y - y0)
+            cv2.putText(self.premultiplied, text, origin, font, font_scale, color, thickness, cv2.LINE_AA)
+            cv2.putText(self.coverage, text, origin, font, font_scale, (255, 255, 255), thickness, cv2.LINE_AA)
+
+    def draw(self, image):
+        """Composite onto the frame: out = premultiplied + background * (1 - coverage)"""
+        height, width = self.premultiplied.shape[:2]
+        clipped = clip_box(image.shape, self.position[0], self.position[1], width, height)
+        if clipped is None:
+            return
+        image_slices, sprite_slices = clipped
+        roi = image[image_slices]
+        # Saturating uint8 arithmetic in place, with no float temporaries
+        cv2.subtract(roi, cv2.multiply(roi, self.coverage[sprite_slices], scale=1 / 255), dst=roi)
+        cv2.add(roi, self.premultiplied[sprite_slices], dst=roi)